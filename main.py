@@ -1,57 +1,153 @@
+import argparse
 import sys
+import threading
 from utils.logger import Logger
+from utils.progress import TransferProgress
 from modules.pve_tools import ProxmoxVMManager
 from pathlib import Path
 from modules.image_manager import ImageManager
+from modules.pipeline import DeploymentPipeline
+from modules.planner import DeploymentPlanner
 
 logger = Logger.get_logger()
-def push_image(config_path: str):
+def distribute_images(manager: ImageManager, images: list):
+    """Replicate images from the seed host to the other cluster nodes"""
+    for img, nodes in manager.distribute_images(images).items():
+        missing = [node for node, ok in nodes.items() if not ok]
+        if missing:
+            logger.error(f"Image {img} is missing on nodes: {missing}")
+
+def find_new_images(manager: ImageManager) -> list:
+    """Find local images that need to be uploaded to the host"""
+    plan = manager.pending_uploads()
+    new_images = plan['upload']
+    logger.info(f"Images to upload: {new_images}")
+    if plan['copy']:
+        logger.info(f"Images copied on the host: {plan['copy']}")
+    for img, source in plan['copy'].items():
+        if not manager.copy_remote_image(source, img):
+            # Upload what could not be copied on the host
+            new_images.append(img)
+            plan['skipped_bytes'] -= manager.verify_image(img, local=True)[1] or 0
+    if manager.sync == 'hash':
+        logger.info(f"Skipped {plan['skipped_bytes'] / 1024 ** 2:.1f} MB of unchanged image content")
+
+    if not new_images:
+        logger.info("No new images to upload")
+    else:
+        logger.info(f"Found {len(new_images)} new images to upload")
+    return new_images
+
+def deploy(vm_manager: ProxmoxVMManager, config_path: str, backend: str = None, reconcile: bool = False):
+    """
+    Upload new images and create all VMs
+
+    VM creation overlaps with the uploads, each VM waits only for its own
+    images. If the images cannot be handled, VMs are created anyway. With
+    reconcile, existing VMs are updated to their configuration instead.
+    """
     try:
         manager = ImageManager.from_yaml(config_path)
-        
-        with manager:
-            local_images = manager.list_local_images()
-            remote_images = manager.list_remote_images()
-            logger.info(f"Local images: {local_images}")
-            logger.info(f"Remote images: {remote_images}")
-            
-            new_images = [img for img in local_images if img not in remote_images]
-            
-            if not new_images:
-                logger.info("No new images to upload")
-                return
-                
-            logger.info(f"Found {len(new_images)} new images to upload")
-            
-            BAR_WIDTH = 50
-            last_percentage = -1
-            GREEN = '\033[32m'
-            RESET = '\033[0m'
-            
-            def show_progress(percentage):
-                nonlocal last_percentage
-                current_percentage = int(percentage)
-                if current_percentage != last_percentage:
-                    filled = int(BAR_WIDTH * percentage / 100)
-                    bar = '#' * filled + '_' * (BAR_WIDTH - filled)
-                    print(f"\r{GREEN}Upload progress: [{bar}] {percentage:.1f}%{RESET}", end='', flush=True)
-                    if percentage >= 100:
-                        print()
-                    last_percentage = current_percentage
-
-            for i, image in enumerate(new_images, 1):
-                logger.info(f"Uploading image {i}/{len(new_images)}: {image}")
-                manager.upload_image(image, callback=show_progress)
-                
+        if backend:
+            manager.backend = backend
+            manager.pipe_requested = backend == 'pipe'
     except Exception as e:
         logger.error(f"Error: {str(e)}")
+        return vm_manager.create_all_vms(reconcile=reconcile)
 
+    # Without the host the images would all look new and fail to upload
+    if not manager.connect():
+        logger.error("Images cannot be handled, creating VMs without uploading")
+        return vm_manager.create_all_vms(reconcile=reconcile)
 
+    try:
+        try:
+            new_images = find_new_images(manager)
+        except Exception as e:
+            logger.error(f"Error: {str(e)}")
+            return vm_manager.create_all_vms(reconcile=reconcile)
+        if not new_images:
+            # Replicate to the other nodes while the VMs are created on the host
+            distributor = threading.Thread(target=distribute_images,
+                                           args=(manager, manager.list_local_images()), daemon=True)
+            distributor.start()
+            result = vm_manager.create_all_vms(reconcile=reconcile)
+            distributor.join()
+            return result
 
-def main():
+        sizes = {img: manager.verify_image(img, local=True)[1] or 0 for img in new_images}
+        # VM creation logs concurrently, so report progress as log lines then
+        progress = TransferProgress(sizes, log_step=10 if vm_manager.config['vms'] else None)
+        result = DeploymentPipeline(vm_manager, manager, reconcile=reconcile).run(new_images, callback=progress.update)
+
+        for stat in manager.transfer_stats:
+            logger.info(f"{stat['filename']}: {stat['sent_bytes'] / 1024 ** 2:.1f} MB sent for "
+                        f"{stat['bytes'] / 1024 ** 2:.1f} MB in {stat['seconds']:.1f}s "
+                        f"via {stat['backend']} ({stat['mb_per_s']:.1f} MB/s)")
+        return result
+    finally:
+        manager.disconnect()
+
+
+
+def plan(vm_manager: ProxmoxVMManager, config_path: str, backend: str = None) -> bool:
+    """
+    Log the operations an apply run would perform and its estimated duration
+
+    Nothing is uploaded, created or reserved. Without a connection to the
+    host the plan covers the VMs only.
+
+    Returns:
+        bool: False if the preflight check failed
+    """
+    manager = None
+    try:
+        manager = ImageManager.from_yaml(config_path)
+        if backend:
+            manager.backend = backend
+            manager.pipe_requested = backend == 'pipe'
+        if not manager.connect():
+            manager = None
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        manager = None
+
+    try:
+        result = DeploymentPlanner(vm_manager, manager).build()
+    finally:
+        if manager:
+            manager.disconnect()
+    if result is None:
+        return False
+
+    logger.info("Plan:")
+    for line in DeploymentPlanner.format(result):
+        logger.info(line)
+    return True
+
+
+def parse_args():
+    """Parse command line arguments"""
     # Get script directory
     script_dir = Path(__file__).parent
-    config_path = script_dir / "./configs/vm_config.yaml"
+    parser = argparse.ArgumentParser(description="Upload images and create Proxmox VE virtual machines")
+    parser.add_argument('command', nargs='?', choices=('create', 'apply', 'plan'), default='create',
+                        help="create: create all VMs, failing existing ones (default); "
+                             "apply: create missing VMs and update existing ones to the configuration; "
+                             "plan: show what apply would do and how long it would take, changing nothing")
+    parser.add_argument('-c', '--config', type=Path, default=script_dir / "./configs/vm_config.yaml",
+                        help="Path to the YAML configuration file")
+    parser.add_argument('--full', action='store_true',
+                        help="With apply, compare every existing VM instead of skipping those "
+                             "whose configuration is unchanged since the last run")
+    parser.add_argument('--backend', choices=(*ImageManager.BACKENDS, 'auto'),
+                        help="Image transfer backend, overrides sshcfg.backend")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config_path = args.config
 
     logger.info("Start checking config files")
     # Check if configuration file exists
@@ -61,20 +157,23 @@ def main():
 
     # Create VM manager
     vm_manager = ProxmoxVMManager(str(config_path))
+    vm_manager.trust_applied_state = not args.full
 
     # Display configuration information
     logger.info(f"Configuration file loaded: {config_path}")
     logger.info(f"Number of VMs to create: {len(vm_manager.config['vms'])}")
 
-    push_image(config_path)
-
     # # Confirm whether to continue
     # if input("\nProceed with VM creation? (y/N): ").lower() != 'y':
     #     logger.info("Operation cancelled")
     #     sys.exit(0)
 
-    # Create virtual machines
-    success, failed = vm_manager.create_all_vms()
+    if args.command == 'plan':
+        sys.exit(0 if plan(vm_manager, config_path, backend=args.backend) else 1)
+
+    # Upload images and create virtual machines
+    success, failed = deploy(vm_manager, config_path, backend=args.backend,
+                             reconcile=args.command == 'apply')
 
     # Exit code
     sys.exit(1 if failed > 0 else 0)
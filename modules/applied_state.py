@@ -0,0 +1,55 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+from utils.state import load_json, save_json
+
+
+class AppliedState:
+    """Persist a hash of the config last applied to every VM to skip untouched VMs"""
+
+    def __init__(self, path: Path):
+        """
+        Initialize applied config state
+
+        Args:
+            path: JSON state file mapping VM ID to `{hash, digest}`, where
+                digest is the PVE config digest seen when the VM was last
+                verified, or None if it changed since
+        """
+        self.path = Path(path)
+        self.entries = load_json(self.path, {})
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def config_hash(params: dict) -> str:
+        """Hash normalized create parameters"""
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def matches(self, vmid: int, config_hash: str) -> bool:
+        """Whether the config hash is the one last applied to the VM"""
+        with self._lock:
+            return self.entries.get(str(vmid), {}).get('hash') == config_hash
+
+    def digest(self, vmid: int) -> Optional[str]:
+        """Get the config digest recorded when the VM was last verified"""
+        with self._lock:
+            return self.entries.get(str(vmid), {}).get('digest')
+
+    def record(self, vmid: int, config_hash: str, digest: Optional[str] = None):
+        """Record the config applied to a VM"""
+        with self._lock:
+            self.entries[str(vmid)] = {'hash': config_hash, 'digest': digest}
+
+    def prune(self, vmids: Iterable[int]):
+        """Forget VMs that no longer exist"""
+        keep = {str(vmid) for vmid in vmids}
+        with self._lock:
+            self.entries = {vmid: entry for vmid, entry in self.entries.items() if vmid in keep}
+
+    def save(self):
+        """Write the state file"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            save_json(self.path, self.entries, sync=True)
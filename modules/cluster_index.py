@@ -0,0 +1,100 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from utils.logger import Logger
+
+
+class ClusterIndex:
+    """Index of all guests in the cluster, built from a single `cluster/resources` call"""
+    logger = Logger.get_logger()
+
+    def __init__(self, resources: List[dict]):
+        """
+        Initialize cluster index
+
+        Args:
+            resources: Entries of `cluster/resources` with type `vm`, covering
+                QEMU VMs and LXC containers on every node
+        """
+        self.guests: Dict[int, dict] = {}
+        self.names: Dict[str, Set[int]] = defaultdict(set)
+        self.tags: Dict[str, Set[int]] = defaultdict(set)
+        for resource in resources:
+            if resource.get('type') not in ('qemu', 'lxc'):
+                continue
+            vmid = int(resource['vmid'])
+            self.guests[vmid] = resource
+            if resource.get('name'):
+                self.names[resource['name']].add(vmid)
+            for tag in self.split_tags(resource.get('tags')):
+                self.tags[tag].add(vmid)
+
+    @classmethod
+    def from_api(cls, proxmox) -> 'ClusterIndex':
+        """Fetch the guests of the whole cluster"""
+        return cls(proxmox.cluster.resources.get(type='vm'))
+
+    @staticmethod
+    def split_tags(tags) -> List[str]:
+        """Split a tag string, PVE separates tags with `;`, `,` or spaces"""
+        if not tags:
+            return []
+        return [tag for tag in str(tags).replace(',', ';').replace(' ', ';').split(';') if tag]
+
+    @property
+    def vmids(self) -> Set[int]:
+        """IDs of all VMs and containers in the cluster"""
+        return set(self.guests)
+
+    def describe(self, vmid: int) -> str:
+        """Describe an existing guest for log messages"""
+        guest = self.guests[vmid]
+        kind = 'Container' if guest.get('type') == 'lxc' else 'VM'
+        return f"{kind} {guest.get('name', '')} (ID: {vmid}) on node {guest.get('node', 'unknown')}"
+
+    def is_managed(self, vmid: int, node: str) -> bool:
+        """Whether a guest is an existing QEMU VM on the node that a reconcile may update"""
+        guest = self.guests.get(vmid)
+        return guest is not None and guest.get('type') == 'qemu' and guest.get('node') == node
+
+    def find_vm(self, name: str, node: str) -> Optional[int]:
+        """Get the ID of the only QEMU VM with the name on the node"""
+        vmids = [vmid for vmid in self.names.get(name, ()) if self.is_managed(vmid, node)]
+        return vmids[0] if len(vmids) == 1 else None
+
+    def check(self, vms: List[dict], reconcile_node: Optional[str] = None) -> Tuple[List[str], List[str]]:
+        """
+        Check VM configurations against the cluster and each other
+
+        VM IDs taken by any VM or container in the cluster, and IDs used
+        twice in the configuration, are errors. Duplicate names are only
+        warned about since PVE allows them.
+
+        Args:
+            vms: VM configurations to be created
+            reconcile_node: Node whose existing QEMU VMs are updated instead
+                of reported as conflicts
+
+        Returns:
+            Tuple[List[str], List[str]]: Error and warning messages
+        """
+        errors = []
+        warnings = []
+        seen_ids: Dict[int, str] = {}
+        seen_names: Set[str] = set()
+        for vm_config in vms:
+            vmid = int(vm_config['id'])
+            name = vm_config['name']
+            if vmid in seen_ids:
+                errors.append(f"VM ID {vmid} is used by both {seen_ids[vmid]} and {name}")
+            seen_ids.setdefault(vmid, name)
+            reconciled = reconcile_node is not None and self.is_managed(vmid, reconcile_node)
+            if vmid in self.guests and not reconciled:
+                errors.append(f"VM ID {vmid} of {name} already exists: {self.describe(vmid)}")
+
+            if name in seen_names:
+                warnings.append(f"VM name {name} is used more than once in the configuration")
+            seen_names.add(name)
+            for other in sorted(self.names.get(name, ())):
+                if other != vmid and not reconciled:
+                    warnings.append(f"VM name {name} is already used by {self.describe(other)}")
+        return errors, warnings
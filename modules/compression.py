@@ -0,0 +1,90 @@
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+# Remote command decompressing stdin to stdout for every algorithm
+DECOMPRESS_COMMANDS = {
+    'gzip': 'gzip -dc',
+    'zstd': 'zstd -dcq',
+}
+
+# Levels tried when choosing the compression level automatically
+CANDIDATE_LEVELS = {
+    'gzip': [1, 3, 6, 9],
+    'zstd': [1, 3, 6, 9, 15],
+}
+
+
+def available_algorithms() -> List[str]:
+    """Compression algorithms usable on this machine, preferred first"""
+    algorithms = ['gzip']
+    if zstandard is not None:
+        algorithms.insert(0, 'zstd')
+    return algorithms
+
+
+def make_compressor(algorithm: str, level: int):
+    """
+    Create a streaming compressor
+
+    Args:
+        algorithm: 'gzip' or 'zstd'
+        level: Compression level
+
+    Returns:
+        Object with compress(data) and flush() methods
+    """
+    if algorithm == 'gzip':
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if algorithm == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package")
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise ValueError(f"Unsupported compression algorithm: {algorithm}")
+
+
+def measure_levels(algorithm: str, sample: bytes) -> Dict[int, Tuple[float, float]]:
+    """
+    Measure compression speed and ratio of every candidate level on a sample
+
+    Returns:
+        Dict[int, Tuple[float, float]]: (input bytes per second, compressed/original ratio) per level
+    """
+    results = {}
+    for level in CANDIDATE_LEVELS[algorithm]:
+        compressor = make_compressor(algorithm, level)
+        start = time.monotonic()
+        size = len(compressor.compress(sample)) + len(compressor.flush())
+        elapsed = max(time.monotonic() - start, 1e-6)
+        results[level] = (len(sample) / elapsed, size / len(sample))
+    return results
+
+
+def choose_level(algorithm: str, sample: bytes, link_speed: float) -> Optional[int]:
+    """
+    Choose the compression level with the highest effective throughput
+
+    A level's effective throughput is the lower of how fast it consumes
+    input on this CPU and how much input per second fits through the link
+    once compressed.
+
+    Args:
+        algorithm: 'gzip' or 'zstd'
+        sample: Representative data of the file to compress
+        link_speed: Measured link throughput in bytes per second
+
+    Returns:
+        Optional[int]: Best level, or None if sending uncompressed is faster
+    """
+    best_level, best_speed = None, link_speed
+    for level, (cpu_speed, ratio) in measure_levels(algorithm, sample).items():
+        speed = min(cpu_speed, link_speed / max(ratio, 1e-6))
+        if speed > best_speed:
+            best_level, best_speed = level, speed
+    return best_level
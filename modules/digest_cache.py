@@ -0,0 +1,58 @@
+import os
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+from utils.state import load_json, save_json
+
+
+class DigestCache:
+    """Persist SHA-256 digests of local files keyed on inode, size and mtime"""
+
+    def __init__(self, path: Path):
+        """
+        Initialize digest cache
+
+        Args:
+            path: Path of the JSON cache file
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries = load_json(self.path, {})
+
+    @staticmethod
+    def _fingerprint(stat: os.stat_result) -> dict:
+        """Attributes that must be unchanged for a cached digest to be valid"""
+        return {'inode': stat.st_ino, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def get(self, file_path: Path) -> Optional[str]:
+        """Get cached digest of a file, None if unknown or the file changed"""
+        fingerprint = self._fingerprint(os.stat(file_path))
+        with self._lock:
+            entry = self._entries.get(str(file_path))
+        if entry and all(entry.get(k) == v for k, v in fingerprint.items()):
+            return entry['sha256']
+        return None
+
+    def put(self, file_path: Path, digest: str, stat: os.stat_result):
+        """
+        Store digest of a file
+
+        Args:
+            file_path: Path of the hashed file
+            digest: SHA-256 hex digest
+            stat: Stat result taken before hashing, so a file modified while
+                being hashed is not cached as unchanged
+        """
+        with self._lock:
+            self._entries[str(file_path)] = dict(self._fingerprint(stat), sha256=digest)
+            save_json(self.path, self._entries)
+
+    def prune(self, file_paths: Iterable[Path]):
+        """Drop cache entries of files not in `file_paths`"""
+        keep = {str(p) for p in file_paths}
+        with self._lock:
+            stale = [key for key in self._entries if key not in keep]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                save_json(self.path, self._entries)
@@ -1,13 +1,69 @@
+import errno
+import functools
+import hashlib
 import os
 from pathlib import Path
 import paramiko
-from typing import Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import queue
+import shlex
+import tempfile
+import threading
+import time
+import uuid
 import yaml
+from modules.compression import DECOMPRESS_COMMANDS, available_algorithms, choose_level, make_compressor
+from modules.digest_cache import DigestCache
+from modules.pve_upload import ProxmoxUploader
+from modules.transfer_journal import TransferJournal
+from utils.state import load_json, save_json
+
+@functools.lru_cache(maxsize=None)
+def _zero_digest(length: int) -> str:
+    """SHA-256 digest of `length` zero bytes, the content of a hole"""
+    return hashlib.sha256(bytes(length)).hexdigest()
+
 
 class ImageManager:
     """Manage image files for Proxmox VE"""
     
+    # Size of a journaled upload chunk
+    CHUNK_SIZE = 8 * 1024 * 1024
+    # Suffix of partially uploaded files on remote
+    PART_SUFFIX = '.part'
+    # Name of the transfer journal kept in the local image directory
+    JOURNAL_NAME = '.transfer_journal.json'
+    # Block size compared by delta uploads
+    DELTA_BLOCK_SIZE = 1024 * 1024
+    # Prints the SHA-256 digest of every block of a file, run on PVE host
+    BLOCK_DIGEST_SCRIPT = (
+        "import hashlib, sys\n"
+        "block_size = int(sys.argv[2])\n"
+        "with open(sys.argv[1], 'rb') as f:\n"
+        "    for block in iter(lambda: f.read(block_size), b''):\n"
+        "        print(hashlib.sha256(block).hexdigest())\n"
+    )
+    # Available transfer backends
+    BACKENDS = ('sftp', 'pipe', 'api')
+    # File types accepted by the storage upload API as iso content
+    API_SUFFIXES = ('.iso', '.img')
+    # Name of the cache of the fastest backend per host kept in the local image directory
+    BACKEND_CACHE_NAME = '.backend_cache.json'
+    # Bytes uploaded with every backend to find the fastest one
+    BACKEND_PROBE_SIZE = 16 * 1024 * 1024
+    # Bytes sent to measure link throughput
+    PROBE_SIZE = 4 * 1024 * 1024
+    # Bytes of a file compressed to choose the compression level
+    COMPRESSION_SAMPLE_SIZE = 4 * 1024 * 1024
+    # Name of the digest cache kept in the local image directory
+    DIGEST_CACHE_NAME = '.image_digests.json'
+    # Name of the recent upload throughput per host kept in the local image directory
+    TRANSFER_HISTORY_NAME = '.transfer_history.json'
+    # Uploads kept per host in the transfer history
+    HISTORY_SAMPLES = 20
+    
     @classmethod
     def from_yaml(cls, yaml_path: str) -> 'ImageManager':
         """
@@ -24,12 +80,37 @@ class ImageManager:
                 config = yaml.safe_load(f)
             
             ssh_config = config.get('sshcfg', {})
+            proxmox_config = config.get('proxmox')
+            api_config = None
+            if proxmox_config:
+                api_config = {
+                    'host': proxmox_config['host'],
+                    'user': proxmox_config['user'],
+                    'password': proxmox_config['password'],
+                    'node': proxmox_config['node'],
+                    'storage': ssh_config.get('api_storage', 'local'),
+                    'verify_ssl': proxmox_config.get('verify_ssl', False),
+                }
             return cls(
                 host=ssh_config.get('host'),
                 user=ssh_config.get('user'),
                 password=ssh_config.get('password'),
                 local_path=ssh_config.get('local_image'),
-                remote_path=ssh_config.get('remote_image')
+                remote_path=ssh_config.get('remote_image'),
+                parallel=ssh_config.get('parallel', 1),
+                sync=ssh_config.get('sync', 'name'),
+                delta=ssh_config.get('delta', False),
+                compression=ssh_config.get('compression', 'none'),
+                compression_level=ssh_config.get('compression_level'),
+                backend=ssh_config.get('backend'),
+                backend_ttl=ssh_config.get('backend_ttl', 86400),
+                window_size=ssh_config.get('window_size'),
+                max_packet_size=ssh_config.get('max_packet_size'),
+                pipelined=ssh_config.get('pipelined', True),
+                buffer_size=ssh_config.get('buffer_size', -1),
+                api_config=api_config,
+                nodes=ssh_config.get('nodes'),
+                topology=ssh_config.get('topology', 'tree')
             )
         except Exception as e:
             raise ValueError(f"Failed to load configuration from {yaml_path}: {str(e)}")
@@ -37,7 +118,21 @@ class ImageManager:
     def __init__(self, host: str, user: str, password: str, 
                  local_path: str = "./images",
                  remote_path: str = "/var/lib/vz/images/install",
-                 port: int = 22):
+                 port: int = 22,
+                 parallel: int = 1,
+                 sync: str = 'name',
+                 delta: bool = False,
+                 compression: str = 'none',
+                 compression_level: Optional[int] = None,
+                 backend: Optional[str] = None,
+                 backend_ttl: int = 86400,
+                 window_size: Optional[int] = None,
+                 max_packet_size: Optional[int] = None,
+                 pipelined: bool = True,
+                 buffer_size: int = -1,
+                 api_config: Optional[dict] = None,
+                 nodes: Optional[List[str]] = None,
+                 topology: str = 'tree'):
         """
         Initialize Image Manager
         
@@ -48,9 +143,44 @@ class ImageManager:
             local_path: Local path for images
             remote_path: Remote path for images
             port: SSH port (default: 22)
+            parallel: Number of concurrent SFTP sessions used by upload_images (default: 1)
+            sync: How to decide which images to upload, 'name' compares file
+                names and sizes, 'hash' compares SHA-256 content digests (default: 'name')
+            delta: Send only changed blocks when overwriting an existing remote file (default: False)
+            compression: Stream uploads through 'gzip' or 'zstd' into a remote
+                decompressor, 'auto' picks the best available algorithm (default: 'none')
+            compression_level: Fixed compression level, chosen from measured
+                link and CPU throughput if not set
+            backend: Transfer backend, one of 'sftp', 'pipe' or 'api', or 'auto'
+                to probe and use the fastest one
+                (default: 'pipe' if compression is enabled, 'sftp' otherwise)
+            backend_ttl: Seconds the fastest backend found by probing a host
+                stays cached (default: 86400)
+            window_size: SSH channel window size in bytes (default: paramiko default)
+            max_packet_size: SSH channel max packet size in bytes (default: paramiko default)
+            pipelined: Send SFTP writes without waiting for each acknowledgement (default: True)
+            buffer_size: Read-ahead buffer size in bytes of local and remote
+                files (default: -1, the io default)
+            api_config: ProxmoxUploader arguments used by the 'api' backend
+            nodes: Other cluster nodes receiving the images from host, as
+                addresses reachable from host over SSH with key authentication
+            topology: How images spread between nodes, 'chain' or 'tree' (default: 'tree')
         """
         if not all([host, user, password]):
             raise ValueError("Host, user, and password are required")
+        if sync not in ('name', 'hash'):
+            raise ValueError(f"Unsupported sync mode: {sync}")
+        if compression not in ('none', 'auto', *DECOMPRESS_COMMANDS):
+            raise ValueError(f"Unsupported compression: {compression}")
+        if topology not in ('chain', 'tree'):
+            raise ValueError(f"Unsupported distribution topology: {topology}")
+        # Without compression an explicitly requested pipe still streams, the
+        # default one falls back to the resumable sftp upload
+        self.pipe_requested = backend == 'pipe'
+        if backend is None:
+            backend = 'sftp' if compression == 'none' else 'pipe'
+        if backend not in (*self.BACKENDS, 'auto'):
+            raise ValueError(f"Unsupported transfer backend: {backend}")
             
         self.host = host
         self.user = user
@@ -58,6 +188,27 @@ class ImageManager:
         self.port = port
         self.local_path = Path(local_path)
         self.remote_path = remote_path
+        self.parallel = max(1, int(parallel or 1))
+        self.sync = sync
+        self.delta = delta
+        self.compression = compression
+        self.compression_level = compression_level
+        self.backend = backend
+        self.backend_ttl = backend_ttl
+        self._auto_backend = None
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.pipelined = pipelined
+        self.buffer_size = buffer_size
+        self.transfer_stats = []
+        self.nodes = list(nodes or [])
+        self.topology = topology
+        self._backend_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        self.api_config = api_config
+        self.uploader = None
+        self._link_speed = None
+        self._remote_commands = {}
         
         # Create local directory if it doesn't exist
         self.local_path.mkdir(parents=True, exist_ok=True)
@@ -65,24 +216,74 @@ class ImageManager:
         self.ssh = None
         self.sftp = None
         self.logger = logging.getLogger('ProxmoxManager')
+        self.journal = TransferJournal(self.local_path / self.JOURNAL_NAME)
+        self.digest_cache = DigestCache(self.local_path / self.DIGEST_CACHE_NAME)
+
+    def _open_session(self) -> Tuple[paramiko.SSHClient, paramiko.SFTPClient]:
+        """Open a new SSH connection and SFTP session to PVE host"""
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            hostname=self.host,
+            username=self.user,
+            password=self.password,
+            port=self.port
+        )
+        transport = ssh.get_transport()
+        # Applies to every channel opened later, including exec pipes
+        if self.window_size:
+            transport.default_window_size = self.window_size
+        if self.max_packet_size:
+            transport.default_max_packet_size = self.max_packet_size
+        return ssh, paramiko.SFTPClient.from_transport(transport, window_size=self.window_size,
+                                                       max_packet_size=self.max_packet_size)
 
     def connect(self) -> bool:
         """Establish SSH connection to PVE host"""
         try:
-            self.ssh = paramiko.SSHClient()
-            self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.ssh.connect(
-                hostname=self.host,
-                username=self.user,
-                password=self.password,
-                port=self.port
-            )
-            self.sftp = self.ssh.open_sftp()
+            self.ssh, self.sftp = self._open_session()
             self.logger.info(f"Successfully connected to {self.host}")
-            return True
         except Exception as e:
             self.logger.error(f"Failed to connect to {self.host}: {str(e)}")
-            return False
+            if not self._api_only(None):
+                return False
+            self.logger.warning("Continuing without SSH, images are only uploaded through the storage API")
+        self._check_api_target()
+        return True
+
+    def _api_only(self, sftp: Optional[paramiko.SFTPClient]) -> bool:
+        """Whether uploads go through the storage API without an SFTP session"""
+        return sftp is None and self.backend == 'api' and bool(self.api_config)
+
+    def _api_uploader(self) -> ProxmoxUploader:
+        """Get the uploader of the 'api' backend"""
+        if self.uploader is None:
+            if not self.api_config:
+                raise ValueError("The api backend requires the proxmox configuration section")
+            self.uploader = ProxmoxUploader(**self.api_config)
+        return self.uploader
+
+    def _check_api_target(self):
+        """
+        Point remote_path at the directory the 'api' backend uploads into
+        
+        The storage API always writes into the iso directory of the storage,
+        so existence checks, name sync and probe cleanup must look there too.
+        """
+        if self.backend not in ('api', 'auto') or not self.api_config:
+            return
+        storage = self.api_config.get('storage', 'local')
+        try:
+            target = self._api_uploader().storage_dir()
+        except Exception as e:
+            self.logger.warning(f"Failed to look up the iso directory of storage {storage}: {str(e)}")
+            return
+        if target is None:
+            self.logger.warning(f"Storage {storage} has no local path, remote_image cannot be checked against it")
+        elif os.path.normpath(target) != os.path.normpath(self.remote_path):
+            self.logger.warning(f"remote_image {self.remote_path} is not the iso directory of storage "
+                                f"{storage}, using {target}")
+            self.remote_path = target
 
     def disconnect(self):
         """Close SSH connection"""
@@ -117,10 +318,12 @@ class ImageManager:
     def list_remote_images(self) -> List[str]:
         """List image files in remote directory"""
         try:
-            if not self.sftp:
+            if self._api_only(self.sftp):
+                files = list(self._api_uploader().list_files())
+            elif not self.sftp:
                 raise ConnectionError("Not connected to PVE host")
-            
-            files = self.sftp.listdir(self.remote_path)
+            else:
+                files = self.sftp.listdir(self.remote_path)
             # 添加 .iso 到支持的文件格式中
             image_files = [f for f in files if f.lower().endswith(('.img', '.qcow2', '.raw', '.iso'))]
             self.logger.info(f"Found {len(image_files)} remote image files")
@@ -130,19 +333,39 @@ class ImageManager:
             return []
 
 
-    def upload_image(self, filename: str, callback=None) -> bool:
+    def upload_image(self, filename: str, callback=None,
+                     sftp: Optional[paramiko.SFTPClient] = None,
+                     overwrite: bool = False) -> bool:
         """
         Upload image file to PVE host
         
+        The file is written in chunks to `<name>.part` on the remote side and
+        renamed once complete. Only the data extents of sparse files are sent,
+        holes are recreated on the remote side. Every acknowledged chunk is
+        recorded in the transfer journal, so an interrupted upload resumes
+        from the last verified chunk on the next call. When delta transfer is
+        enabled and the remote file is being overwritten, only changed blocks
+        are sent.
+        
+        The 'pipe' backend instead streams the file, compressed if that pays
+        off, into a remote command. The 'api' backend uploads through the
+        Proxmox storage upload API, and needs no SFTP session if connect
+        could not open one. Neither of them is journaled.
+        
         Args:
             filename: Name of the image file in local directory
-            callback: Optional callback function for progress updates
+            callback: Optional callback function for progress updates,
+                called with (transferred_bytes, total_bytes)
+            sftp: SFTP session to use (default: the session opened by connect)
+            overwrite: Replace the remote file if it already exists
         
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            if not self.sftp:
+            sftp = sftp or self.sftp
+            api_only = self._api_only(sftp)
+            if not sftp and not api_only:
                 raise ConnectionError("Not connected to PVE host")
 
             local_file = self.local_path / filename
@@ -152,30 +375,530 @@ class ImageManager:
             remote_file = os.path.join(self.remote_path, filename)
             
             # Check if file already exists
-            try:
-                self.sftp.stat(remote_file)
+            if api_only:
+                remote_exists = filename in self._api_uploader().list_files()
+            else:
+                try:
+                    sftp.stat(remote_file)
+                    remote_exists = True
+                except FileNotFoundError:
+                    remote_exists = False
+            if remote_exists and not overwrite:
                 self.logger.warning(f"File {filename} already exists on remote")
                 return False
-            except FileNotFoundError:
-                pass
 
-            # Define progress callback if needed
-            if callback:
-                def progress_callback(transferred: int, total: int):
-                    percentage = (transferred / total) * 100
-                    callback(percentage)
+            start_time = time.monotonic()
+            backend = self._resolve_backend(sftp)
+            if backend == 'api' and local_file.suffix.lower() not in self.API_SUFFIXES:
+                if api_only:
+                    raise ValueError(f"The api backend only accepts {self.API_SUFFIXES} files")
+                self.logger.warning(f"The api backend only accepts {self.API_SUFFIXES} files, "
+                                    f"uploading {filename} over sftp")
+                backend = 'sftp'
 
-                self.sftp.put(str(local_file), remote_file, callback=progress_callback)
+            if remote_exists and self.delta and not api_only:
+                backend, sent = self._put_delta(sftp, filename, local_file, remote_file, callback)
             else:
-                self.sftp.put(str(local_file), remote_file)
+                backend, sent = self._put_backend(backend, sftp, filename, local_file, remote_file,
+                                                  remote_exists, callback)
 
-            self.logger.info(f"Successfully uploaded {filename}")
+            # Throughput counts the bytes that crossed the link, not the file size
+            elapsed = max(time.monotonic() - start_time, 1e-6)
+            size = local_file.stat().st_size
+            self.transfer_stats.append({
+                'filename': filename,
+                'backend': backend,
+                'bytes': size,
+                'sent_bytes': sent,
+                'seconds': elapsed,
+                'mb_per_s': sent / 1024 ** 2 / elapsed,
+            })
+            self._record_transfer(backend, sent, elapsed)
+            self.logger.info(f"Successfully uploaded {filename} via {backend} "
+                             f"({sent / 1024 ** 2 / elapsed:.1f} MB/s)")
             return True
 
         except Exception as e:
             self.logger.error(f"Failed to upload image: {str(e)}")
             return False
 
+    def _record_transfer(self, backend: str, size: int, seconds: float):
+        """Add an upload to the transfer history of the host"""
+        try:
+            with self._history_lock:
+                history_path = self.local_path / self.TRANSFER_HISTORY_NAME
+                history = load_json(history_path, {})
+                samples = history.setdefault(self.host, [])
+                samples.append({'backend': backend, 'bytes': size, 'seconds': seconds, 'time': time.time()})
+                del samples[:-self.HISTORY_SAMPLES]
+                save_json(history_path, history)
+        except Exception as e:
+            self.logger.warning(f"Failed to record transfer history: {str(e)}")
+
+    def expected_throughput(self) -> Optional[float]:
+        """
+        Estimate the upload throughput to the host from earlier runs
+        
+        Recent uploads are preferred, backend probe results are used if no
+        upload was recorded yet.
+        
+        Returns:
+            Optional[float]: Bytes per second, None without any measurement
+        """
+        samples = load_json(self.local_path / self.TRANSFER_HISTORY_NAME, {}).get(self.host)
+        if samples:
+            return sum(s['bytes'] for s in samples) / max(sum(s['seconds'] for s in samples), 1e-6)
+        entry = load_json(self.local_path / self.BACKEND_CACHE_NAME, {}).get(self.host)
+        if entry and entry.get('speeds'):
+            return max(entry['speeds'].values())
+        return None
+
+    def pending_uploads(self) -> Dict[str, object]:
+        """
+        Find local images that are not on the host yet, without changing anything
+        
+        With sync 'hash' images are compared by content, see `plan_sync`. With
+        sync 'name' images are compared by name, and a remote file whose size
+        differs from the local one is a leftover of an interrupted upload that
+        must be uploaded again.
+        
+        Returns:
+            Dict with the keys of `plan_sync`, copy is empty for sync 'name'
+        """
+        if self.sync == 'hash':
+            return self.plan_sync()
+
+        local_images = self.list_local_images()
+        remote_images = self.list_remote_images()
+        plan = {'upload': [], 'copy': {}, 'skipped_bytes': 0}
+        for img in local_images:
+            if img not in remote_images:
+                plan['upload'].append(img)
+            elif self.verify_image(img)[1] != self.verify_image(img, local=True)[1]:
+                self.logger.warning(f"Remote image {img} is incomplete, uploading it again")
+                plan['upload'].append(img)
+        return plan
+
+    def _put_backend(self, backend: str, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                     remote_file: str, remote_exists: bool, callback=None) -> Tuple[str, int]:
+        """
+        Upload a file with the given transfer backend
+        
+        A pipe that is only the default for enabled compression falls back
+        to the resumable sftp backend if compression does not pay off. An
+        explicitly requested or probed pipe always streams.
+        
+        Returns:
+            Tuple[str, int]: Backend that actually transferred the file and
+            the bytes it sent
+        """
+        if backend == 'api':
+            sent = self._put_api(sftp, filename, local_file, remote_file, remote_exists, callback)
+        elif backend == 'pipe':
+            algorithm, level = self._select_compression(sftp, local_file)
+            if algorithm is None and self.backend == 'pipe' and not self.pipe_requested:
+                self.logger.info(f"Compression does not pay off for {filename}, uploading it over sftp")
+                backend = 'sftp'
+                sent = self._put_chunked(sftp, filename, local_file, remote_file, callback)
+            else:
+                sent = self._put_pipe(sftp, filename, local_file, remote_file, callback, algorithm, level)
+        else:
+            sent = self._put_chunked(sftp, filename, local_file, remote_file, callback)
+        return backend, sent
+
+    def _probe_backends(self, sftp: paramiko.SFTPClient) -> Dict[str, float]:
+        """
+        Measure the throughput of every usable transfer backend
+        
+        A file of random data is uploaded with each backend and removed again.
+        The pipe backend is only a candidate with compression enabled, an
+        uncompressed pipe gives up resuming and sparse handling.
+        
+        Returns:
+            Dict[str, float]: Bytes per second for every backend that succeeded
+        """
+        candidates = [b for b in self.BACKENDS
+                      if (b != 'api' or self.api_config) and (b != 'pipe' or self.compression != 'none')]
+        speeds = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            probe_file = Path(tmp_dir) / f"pve-backend-probe-{uuid.uuid4().hex[:8]}.iso"
+            probe_file.write_bytes(os.urandom(self.BACKEND_PROBE_SIZE))
+            remote_file = os.path.join(self.remote_path, probe_file.name)
+            part_file = remote_file + self.PART_SUFFIX
+            for backend in candidates:
+                start_time = time.monotonic()
+                try:
+                    self._put_backend(backend, sftp, probe_file.name, probe_file, remote_file, False)
+                    speeds[backend] = self.BACKEND_PROBE_SIZE / max(time.monotonic() - start_time, 1e-6)
+                    self.logger.info(f"Backend {backend} to {self.host}: {speeds[backend] / 1024 ** 2:.1f} MB/s")
+                except Exception as e:
+                    self.logger.warning(f"Backend {backend} probe failed: {str(e)}")
+                finally:
+                    self.journal.finish(self._journal_key(part_file))
+                    for path in (remote_file, part_file):
+                        try:
+                            sftp.remove(path)
+                        except IOError:
+                            pass
+
+        # Random probe data is incompressible, the pipe result is the raw link speed
+        if 'pipe' in speeds and self._link_speed is None:
+            self._link_speed = speeds['pipe']
+        return speeds
+
+    def _resolve_backend(self, sftp: paramiko.SFTPClient) -> str:
+        """
+        Get the transfer backend to use
+        
+        With backend 'auto', the fastest backend for the host is taken from
+        the backend cache, or probed and cached if there is no fresh entry.
+        """
+        if self.backend != 'auto':
+            return self.backend
+        with self._backend_lock:
+            if self._auto_backend:
+                return self._auto_backend
+
+            cache_path = self.local_path / self.BACKEND_CACHE_NAME
+            cache = load_json(cache_path, {})
+            entry = cache.get(self.host)
+            if entry and time.time() - entry['time'] < self.backend_ttl:
+                self._auto_backend = entry['backend']
+                self.logger.info(f"Using cached fastest backend {self._auto_backend} for {self.host}")
+                return self._auto_backend
+
+            self.logger.info(f"Probing transfer backends for {self.host}")
+            speeds = self._probe_backends(sftp)
+            if not speeds:
+                self.logger.warning("All backend probes failed, falling back to sftp")
+                self._auto_backend = 'sftp'
+                return self._auto_backend
+            self._auto_backend = max(speeds, key=speeds.get)
+            cache[self.host] = {'backend': self._auto_backend, 'speeds': speeds, 'time': time.time()}
+            save_json(cache_path, cache)
+            self.logger.info(f"Selected backend {self._auto_backend} for {self.host}")
+            return self._auto_backend
+
+    def _journal_key(self, part_file: str) -> str:
+        """Key identifying a remote partial file in the transfer journal"""
+        return f"{self.host}:{part_file}"
+
+    def _resume_offset(self, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                       part_file: str) -> int:
+        """
+        Find the offset an interrupted upload can resume from
+        
+        The journal entry is only trusted if the local file is unchanged and
+        the last committed chunk still matches the remote partial file.
+        Chunks that fail verification are dropped from the journal.
+        
+        Returns:
+            int: Number of bytes already committed on remote, 0 to restart
+        """
+        entry = self.journal.get(self._journal_key(part_file))
+        if not entry or not entry['chunks']:
+            return 0
+
+        stat = local_file.stat()
+        if (entry['remote_file'] != part_file or entry['size'] != stat.st_size
+                or entry['mtime_ns'] != stat.st_mtime_ns or entry['chunk_size'] != self.CHUNK_SIZE):
+            self.logger.info(f"Local file {filename} changed since last attempt, restarting upload")
+            return 0
+
+        try:
+            remote_size = sftp.stat(part_file).st_size
+        except FileNotFoundError:
+            return 0
+
+        chunks = entry['chunks']
+        with open(local_file, 'rb') as local_f, sftp.open(part_file, 'rb') as remote_f:
+            while chunks:
+                index = len(chunks) - 1
+                start = index * self.CHUNK_SIZE
+                end = min(start + self.CHUNK_SIZE, stat.st_size)
+                if end <= remote_size:
+                    local_f.seek(start)
+                    remote_f.seek(start)
+                    data = remote_f.read(end - start)
+                    if (hashlib.sha256(data).hexdigest() == chunks[index]
+                            and hashlib.sha256(local_f.read(end - start)).hexdigest() == chunks[index]):
+                        break
+                self.logger.warning(f"Chunk {index} of {filename} failed verification, discarding it")
+                chunks.pop()
+
+        self.journal.truncate(self._journal_key(part_file), len(chunks))
+        return min(len(chunks) * self.CHUNK_SIZE, stat.st_size)
+
+    def _put_chunked(self, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                     remote_file: str, callback=None) -> int:
+        """Write local file to remote in journaled chunks and move it into place, returning the bytes sent"""
+        part_file = remote_file + self.PART_SUFFIX
+        journal_key = self._journal_key(part_file)
+        stat = local_file.stat()
+        total = stat.st_size
+
+        offset = self._resume_offset(sftp, filename, local_file, part_file)
+        if offset:
+            self.logger.info(f"Resuming upload of {filename} at {offset}/{total} bytes")
+        else:
+            self.journal.start(journal_key, part_file, total, stat.st_mtime_ns, self.CHUNK_SIZE)
+
+        data_bytes = 0
+        with open(local_file, 'rb', buffering=self.buffer_size) as local_f, \
+                sftp.open(part_file, 'r+' if offset else 'w', bufsize=self.buffer_size) as remote_f:
+            remote_f.set_pipelined(self.pipelined)
+            extents = self._data_extents(local_f, total)
+            # Extend the remote file to full size up front, so the ranges
+            # that are never written stay holes on the remote side
+            remote_f.truncate(offset)
+            remote_f.truncate(total)
+            if callback:
+                callback(offset, total)
+            while offset < total:
+                end = min(offset + self.CHUNK_SIZE, total)
+                ranges = [(max(start, offset), min(stop, end)) for start, stop in extents
+                          if start < end and stop > offset]
+                if ranges:
+                    local_f.seek(offset)
+                    data = local_f.read(end - offset)
+                    if len(data) != end - offset:
+                        raise IOError(f"Local file {local_file} shrank during upload")
+                    for index, (start, stop) in enumerate(ranges):
+                        remote_f.seek(start)
+                        if index == len(ranges) - 1:
+                            # Wait for the server to acknowledge the chunk before committing it
+                            self._write_acknowledged(remote_f, data[start - offset:stop - offset])
+                        else:
+                            remote_f.write(data[start - offset:stop - offset])
+                        data_bytes += stop - start
+                    digest = hashlib.sha256(data).hexdigest()
+                else:
+                    digest = _zero_digest(end - offset)
+                self.journal.commit_chunk(journal_key, digest)
+                offset = end
+                if callback:
+                    callback(offset, total)
+
+        if data_bytes < total:
+            self.logger.info(f"Sent {data_bytes / 1024 ** 2:.1f} MB of data for "
+                             f"{total / 1024 ** 2:.1f} MB sparse file {filename}")
+        self._move_into_place(sftp, part_file, remote_file)
+        self.journal.finish(journal_key)
+        return data_bytes
+
+    def _write_acknowledged(self, remote_f: paramiko.SFTPFile, data: bytes):
+        """
+        Write data and wait until the server acknowledged every pending write
+        
+        With pipelining, writes are only sent and their status is collected
+        later. Writing the last request synchronously makes paramiko collect
+        and check the status of all queued writes first.
+        """
+        if not self.pipelined:
+            remote_f.write(data)
+            remote_f.flush()
+            return
+        tail = min(len(data), remote_f.MAX_REQUEST_SIZE)
+        remote_f.write(data[:len(data) - tail])
+        remote_f.flush()
+        remote_f.set_pipelined(False)
+        try:
+            remote_f.write(data[len(data) - tail:])
+            remote_f.flush()
+        finally:
+            remote_f.set_pipelined(True)
+
+    @staticmethod
+    def _data_extents(file_obj, size: int) -> List[Tuple[int, int]]:
+        """
+        Find the data extents of a local file with SEEK_DATA/SEEK_HOLE
+        
+        Returns:
+            List[Tuple[int, int]]: (start, end) offsets of every range holding
+            data, or the whole file if holes cannot be detected
+        """
+        if not hasattr(os, 'SEEK_DATA'):
+            return [(0, size)]
+        fd = file_obj.fileno()
+        extents = []
+        offset = 0
+        try:
+            while offset < size:
+                try:
+                    start = os.lseek(fd, offset, os.SEEK_DATA)
+                except OSError as e:
+                    # No data after offset, the rest of the file is a hole
+                    if e.errno == errno.ENXIO:
+                        break
+                    raise
+                end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+                extents.append((start, end))
+                offset = end
+        except OSError:
+            # Filesystem without hole detection
+            return [(0, size)]
+        finally:
+            os.lseek(fd, 0, os.SEEK_SET)
+        return extents
+
+    def _move_into_place(self, sftp: paramiko.SFTPClient, part_file: str, remote_file: str):
+        """Atomically replace remote file with a completed partial file"""
+        try:
+            sftp.posix_rename(part_file, remote_file)
+        except IOError:
+            # Server without posix-rename extension, fall back to plain rename
+            try:
+                sftp.remove(remote_file)
+            except FileNotFoundError:
+                pass
+            sftp.rename(part_file, remote_file)
+
+    def _block_digests(self, file_obj) -> List[str]:
+        """Compute SHA-256 digest of every DELTA_BLOCK_SIZE block of an open file"""
+        return [hashlib.sha256(block).hexdigest()
+                for block in iter(lambda: file_obj.read(self.DELTA_BLOCK_SIZE), b'')]
+
+    def _remote_block_digests(self, remote_file: str) -> List[str]:
+        """Compute block digests of a remote file with python3 on PVE host"""
+        command = (f"python3 -c {shlex.quote(self.BLOCK_DIGEST_SCRIPT)} "
+                   f"{shlex.quote(remote_file)} {self.DELTA_BLOCK_SIZE}")
+        return self._exec(command).split()
+
+    def _put_delta(self, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                   remote_file: str, callback=None) -> Tuple[str, int]:
+        """
+        Update an existing remote file by sending only the blocks that changed
+        
+        The remote file is copied to `<name>.part`, changed blocks are written
+        into the copy at their offsets, and the copy is renamed over the
+        original once complete. If the remote block digests cannot be
+        computed, e.g. without python3 on the host, the whole file is
+        uploaded with the journaled sftp backend instead.
+        
+        Returns:
+            Tuple[str, int]: 'delta' if only changed blocks were sent, 'sftp'
+            if the whole file was uploaded, and the bytes sent
+        """
+        try:
+            remote_digests = self._remote_block_digests(remote_file)
+        except Exception as e:
+            self.logger.warning(f"Failed to compute remote block digests of {filename}, "
+                                f"uploading the whole file: {str(e)}")
+            return 'sftp', self._put_chunked(sftp, filename, local_file, remote_file, callback)
+        total = local_file.stat().st_size
+        with open(local_file, 'rb') as local_f:
+            local_digests = self._block_digests(local_f)
+
+        changed = [index for index, digest in enumerate(local_digests)
+                   if index >= len(remote_digests) or remote_digests[index] != digest]
+        delta_bytes = sum(min(self.DELTA_BLOCK_SIZE, total - index * self.DELTA_BLOCK_SIZE) for index in changed)
+        self.logger.info(f"Delta upload of {filename}: {len(changed)}/{len(local_digests)} blocks changed, "
+                         f"sending {delta_bytes / 1024 ** 2:.1f} MB of {total / 1024 ** 2:.1f} MB")
+
+        part_file = remote_file + self.PART_SUFFIX
+        self._exec(f"cp --reflink=auto {shlex.quote(remote_file)} {shlex.quote(part_file)}")
+
+        sent = 0
+        with open(local_file, 'rb', buffering=self.buffer_size) as local_f, \
+                sftp.open(part_file, 'r+', bufsize=self.buffer_size) as remote_f:
+            remote_f.set_pipelined(self.pipelined)
+            remote_f.truncate(total)
+            if callback:
+                callback(sent, delta_bytes)
+            for position, index in enumerate(changed):
+                offset = index * self.DELTA_BLOCK_SIZE
+                local_f.seek(offset)
+                data = local_f.read(self.DELTA_BLOCK_SIZE)
+                remote_f.seek(offset)
+                if position == len(changed) - 1:
+                    # Collect the status of every pipelined write once, before the rename
+                    self._write_acknowledged(remote_f, data)
+                else:
+                    remote_f.write(data)
+                sent += len(data)
+                if callback:
+                    callback(sent, delta_bytes)
+
+        self._move_into_place(sftp, part_file, remote_file)
+        return 'delta', sent
+
+    def upload_images(self, filenames: List[str],
+                      callback: Optional[Callable[[str, int, int], None]] = None,
+                      overwrite: bool = False,
+                      on_complete: Optional[Callable[[str, bool], None]] = None) -> Dict[str, bool]:
+        """
+        Upload several image files concurrently over a pool of SFTP sessions
+        
+        The pool width is taken from `parallel`. The session opened by connect
+        is reused as the first pool member, extra sessions are opened on demand
+        and closed once all transfers have finished.
+        
+        Args:
+            filenames: Names of the image files in local directory
+            callback: Optional callback function for progress updates,
+                called with (filename, transferred_bytes, total_bytes)
+            overwrite: Replace remote files that already exist
+            on_complete: Optional callback function called with
+                (filename, success) as soon as each upload finishes
+        
+        Returns:
+            Dict[str, bool]: Upload result for each filename
+        """
+        if not filenames:
+            return {}
+        api_only = self._api_only(self.sftp)
+        if not self.sftp and not api_only:
+            self.logger.error("Failed to upload images: Not connected to PVE host")
+            if on_complete:
+                for name in filenames:
+                    on_complete(name, False)
+            return {name: False for name in filenames}
+
+        width = min(self.parallel, len(filenames))
+        sessions = queue.Queue()
+        sessions.put(self.sftp)
+        extra_sessions = []
+        if api_only:
+            # Storage API uploads need no session, None stands in for each worker
+            for _ in range(width - 1):
+                sessions.put(None)
+            self.logger.info(f"Uploading {len(filenames)} images through the storage API, {width} at a time")
+        else:
+            for _ in range(width - 1):
+                try:
+                    ssh, sftp = self._open_session()
+                except Exception as e:
+                    self.logger.warning(f"Failed to open extra SFTP session: {str(e)}")
+                    break
+                extra_sessions.append((ssh, sftp))
+                sessions.put(sftp)
+            self.logger.info(f"Uploading {len(filenames)} images over {1 + len(extra_sessions)} SFTP sessions")
+        workers = sessions.qsize()
+
+        def upload(filename: str) -> bool:
+            sftp = sessions.get()
+            try:
+                file_callback = None
+                if callback:
+                    def file_callback(transferred: int, total: int):
+                        callback(filename, transferred, total)
+                result = self.upload_image(filename, callback=file_callback, sftp=sftp,
+                                           overwrite=overwrite)
+            finally:
+                sessions.put(sftp)
+            if on_complete:
+                on_complete(filename, result)
+            return result
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(filenames, executor.map(upload, filenames)))
+        finally:
+            for ssh, sftp in extra_sessions:
+                sftp.close()
+                ssh.close()
+        return results
+
     def delete_image(self, filename: str, local: bool = False) -> bool:
         """
         Delete image file from PVE host or local directory
@@ -222,6 +945,11 @@ class ImageManager:
                     return True, local_file.stat().st_size
                 return False, None
             else:
+                if self._api_only(self.sftp):
+                    files = self._api_uploader().list_files()
+                    if filename not in files:
+                        raise FileNotFoundError(filename)
+                    return True, files[filename]
                 if not self.sftp:
                     raise ConnectionError("Not connected to PVE host")
                 remote_file = os.path.join(self.remote_path, filename)
@@ -233,3 +961,343 @@ class ImageManager:
         except Exception as e:
             self.logger.error(f"Failed to verify image {filename}: {str(e)}")
             return False, None
+
+    def _exec(self, command: str) -> str:
+        """
+        Run a shell command on PVE host over the existing SSH connection
+        
+        Args:
+            command: Shell command to run
+            
+        Returns:
+            str: Standard output of the command
+        """
+        if not self.ssh:
+            raise ConnectionError("Not connected to PVE host")
+        _, stdout, stderr = self.ssh.exec_command(command)
+        output = stdout.read().decode()
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise RuntimeError(f"Remote command failed ({exit_status}): {stderr.read().decode().strip()}")
+        return output
+
+    def local_digest(self, filename: str) -> str:
+        """Get SHA-256 digest of a local image file, hashing it only if not cached"""
+        local_file = self.local_path / filename
+        digest = self.digest_cache.get(local_file)
+        if digest:
+            return digest
+
+        self.logger.info(f"Computing SHA-256 of {filename}")
+        stat = local_file.stat()
+        sha256 = hashlib.sha256()
+        with open(local_file, 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        self.digest_cache.put(local_file, digest, stat)
+        return digest
+
+    def remote_digests(self, filenames: List[str]) -> Dict[str, str]:
+        """
+        Compute SHA-256 digests of remote image files with sha256sum
+        
+        Args:
+            filenames: Names of the image files in remote directory
+            
+        Returns:
+            Dict[str, str]: Digest for each filename
+        """
+        if not filenames:
+            return {}
+        command = (f"cd {shlex.quote(self.remote_path)} && sha256sum -- "
+                   + ' '.join(shlex.quote(name) for name in filenames))
+        digests = {}
+        for line in self._exec(command).splitlines():
+            digest, _, name = line.partition('  ')
+            digests[name] = digest
+        return digests
+
+    def copy_remote_image(self, source: str, target: str) -> bool:
+        """
+        Copy an image file within the remote directory
+        
+        Args:
+            source: Name of the existing remote image file
+            target: Name of the remote image file to create
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            source_file = shlex.quote(os.path.join(self.remote_path, source))
+            target_file = os.path.join(self.remote_path, target)
+            part_file = shlex.quote(target_file + self.PART_SUFFIX)
+            self._exec(f"cp --reflink=auto {source_file} {part_file} && mv -f {part_file} {shlex.quote(target_file)}")
+            self.logger.info(f"Copied remote image {source} to {target}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to copy remote image {source} to {target}: {str(e)}")
+            return False
+
+    def plan_sync(self) -> Dict[str, object]:
+        """
+        Compare local and remote images by SHA-256 content digest
+        
+        Only remote files with the same size as some local image are hashed.
+        Local images whose content already exists remotely under another name
+        are copied on the remote side instead of being uploaded again.
+        
+        Returns:
+            Dict with keys:
+                upload: Names of local images that must be uploaded
+                copy: Mapping of local image name to identical remote image name
+                skipped_bytes: Bytes that do not need to cross the network
+        """
+        if not self.sftp:
+            raise ConnectionError("Not connected to PVE host")
+
+        local_images = self.list_local_images()
+        # Forget the digests of images that were deleted or renamed
+        self.digest_cache.prune(self.local_path / name for name in local_images)
+        local_sizes = {name: (self.local_path / name).stat().st_size for name in local_images}
+        remote_sizes = {attr.filename: attr.st_size for attr in self.sftp.listdir_attr(self.remote_path)
+                        if attr.filename.lower().endswith(('.img', '.qcow2', '.raw', '.iso'))}
+
+        candidates = [name for name, size in remote_sizes.items() if size in set(local_sizes.values())]
+        remote_digests = self.remote_digests(candidates)
+        remote_by_digest = {digest: name for name, digest in remote_digests.items()}
+
+        plan = {'upload': [], 'copy': {}, 'skipped_bytes': 0}
+        for name in local_images:
+            if local_sizes[name] not in remote_sizes.values():
+                plan['upload'].append(name)
+                continue
+            digest = self.local_digest(name)
+            if remote_digests.get(name) == digest:
+                plan['skipped_bytes'] += local_sizes[name]
+            elif digest in remote_by_digest:
+                plan['copy'][name] = remote_by_digest[digest]
+                plan['skipped_bytes'] += local_sizes[name]
+            else:
+                plan['upload'].append(name)
+        return plan
+
+    def _exec_channel(self, sftp: paramiko.SFTPClient, command: str) -> paramiko.Channel:
+        """Start a remote command on the SSH connection carrying an SFTP session"""
+        channel = sftp.get_channel().get_transport().open_session()
+        channel.exec_command(command)
+        return channel
+
+    def _finish_channel(self, channel: paramiko.Channel):
+        """Close stdin of a remote command and raise if it did not succeed"""
+        channel.shutdown_write()
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            stderr = b''
+            while channel.recv_stderr_ready():
+                stderr += channel.recv_stderr(4096)
+            raise RuntimeError(f"Remote command failed ({exit_status}): {stderr.decode().strip()}")
+
+    def _measure_link_speed(self, sftp: paramiko.SFTPClient) -> float:
+        """Measure upload throughput to PVE host in bytes per second"""
+        if self._link_speed is None:
+            data = os.urandom(self.PROBE_SIZE)
+            start = time.monotonic()
+            channel = self._exec_channel(sftp, "cat > /dev/null")
+            channel.sendall(data)
+            self._finish_channel(channel)
+            self._link_speed = len(data) / max(time.monotonic() - start, 1e-6)
+            self.logger.info(f"Measured link speed to {self.host}: {self._link_speed / 1024 ** 2:.1f} MB/s")
+        return self._link_speed
+
+    def _remote_has_command(self, command: str) -> bool:
+        """Check whether a command is installed on PVE host"""
+        if command not in self._remote_commands:
+            try:
+                self._exec(f"command -v {shlex.quote(command)}")
+                self._remote_commands[command] = True
+            except RuntimeError:
+                self._remote_commands[command] = False
+        return self._remote_commands[command]
+
+    def _select_compression(self, sftp: paramiko.SFTPClient,
+                            local_file: Path) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Choose compression algorithm and level for uploading a file
+        
+        Returns:
+            Tuple[Optional[str], Optional[int]]: (algorithm, level), or
+            (None, None) to upload uncompressed
+        """
+        if self.compression == 'none':
+            return None, None
+        candidates = available_algorithms() if self.compression == 'auto' else [self.compression]
+        algorithms = [a for a in candidates if self._remote_has_command(a)]
+        if not algorithms:
+            self.logger.warning(f"No decompressor for {candidates} on {self.host}, uploading uncompressed")
+            return None, None
+        algorithm = algorithms[0]
+        if self.compression_level is not None:
+            return algorithm, self.compression_level
+
+        # Sample evenly spaced slices so the level fits the whole file
+        size = local_file.stat().st_size
+        slices = 4
+        slice_size = self.COMPRESSION_SAMPLE_SIZE // slices
+        with open(local_file, 'rb') as f:
+            sample = b''
+            for index in range(slices):
+                f.seek(max(0, size - slice_size) * index // max(1, slices - 1))
+                sample += f.read(slice_size)
+        if not sample:
+            return None, None
+
+        level = choose_level(algorithm, sample, self._measure_link_speed(sftp))
+        if level is None:
+            self.logger.info(f"Compression does not pay off for {local_file.name}, uploading uncompressed")
+            return None, None
+        self.logger.info(f"Compressing {local_file.name} with {algorithm} level {level}")
+        return algorithm, level
+
+    def _put_pipe(self, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                  remote_file: str, callback, algorithm: Optional[str] = None, level: Optional[int] = None):
+        """
+        Stream a file, compressed if algorithm is set, into a remote command writing remote_file
+        
+        Returns:
+            int: Bytes sent over the channel
+        """
+        part_file = shlex.quote(remote_file + self.PART_SUFFIX)
+        receiver = DECOMPRESS_COMMANDS[algorithm] if algorithm else 'cat'
+        command = f"{receiver} > {part_file} && mv -f {part_file} {shlex.quote(remote_file)}"
+        total = local_file.stat().st_size
+        compressor = make_compressor(algorithm, level) if algorithm else None
+
+        sent = 0
+        transferred = 0
+        channel = self._exec_channel(sftp, command)
+        try:
+            with open(local_file, 'rb') as f:
+                if callback:
+                    callback(transferred, total)
+                for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                    data = compressor.compress(block) if compressor else block
+                    channel.sendall(data)
+                    sent += len(data)
+                    transferred += len(block)
+                    if callback:
+                        callback(transferred, total)
+            if compressor:
+                data = compressor.flush()
+                channel.sendall(data)
+                sent += len(data)
+            self._finish_channel(channel)
+        finally:
+            channel.close()
+        if compressor:
+            self.logger.info(f"Sent {sent / 1024 ** 2:.1f} MB compressed for {total / 1024 ** 2:.1f} MB file {filename}")
+        return sent
+
+    def _put_api(self, sftp: paramiko.SFTPClient, filename: str, local_file: Path,
+                 remote_file: str, remote_exists: bool, callback) -> int:
+        """Upload a file through the Proxmox storage upload API, returning the bytes sent"""
+        uploader = self._api_uploader()
+        # The upload API does not replace existing files
+        if remote_exists and not uploader.delete(filename):
+            raise RuntimeError(f"Failed to delete the existing {filename} from storage")
+        if not uploader.upload(local_file, filename, callback=callback):
+            raise RuntimeError(f"Storage upload of {filename} failed")
+        return local_file.stat().st_size
+
+    def _on_node(self, node: Optional[str], command: str) -> str:
+        """Wrap a command so it runs on a cluster node, None meaning host itself"""
+        if node is None:
+            return command
+        return f"ssh -o BatchMode=yes {shlex.quote(f'{self.user}@{node}')} {shlex.quote(command)}"
+
+    def _copy_to_node(self, filename: str, source: Optional[str], target: str):
+        """Copy a remote image from one cluster node to another over the LAN"""
+        remote_file = os.path.join(self.remote_path, filename)
+        part_file = remote_file + self.PART_SUFFIX
+        copy = (f"scp -q -o BatchMode=yes {shlex.quote(remote_file)} "
+                f"{shlex.quote(f'{self.user}@{target}:{part_file}')} && "
+                + self._on_node(target, f"mv -f {shlex.quote(part_file)} {shlex.quote(remote_file)}"))
+        self._exec(self._on_node(source, copy))
+
+    def _node_has_image(self, node: str, filename: str, size: int) -> bool:
+        """Check whether a cluster node already holds a complete copy of an image"""
+        remote_file = os.path.join(self.remote_path, filename)
+        try:
+            output = self._exec(self._on_node(node, f"stat -c %s {shlex.quote(remote_file)}"))
+            return int(output.strip()) == size
+        except (RuntimeError, ValueError):
+            return False
+
+    def _distribute_image(self, filename: str) -> Dict[str, bool]:
+        """
+        Replicate one image from host to every other cluster node
+        
+        In 'chain' topology every node copies the image to the next one. In
+        'tree' topology the number of nodes holding the image doubles every
+        round, each holder copying to one node still missing it.
+        
+        Returns:
+            Dict[str, bool]: Whether each node holds the image afterwards
+        """
+        size = self.local_path.joinpath(filename).stat().st_size
+        results = {node: self._node_has_image(node, filename, size) for node in self.nodes}
+        missing = [node for node in self.nodes if not results[node]]
+        holders = [None] + [node for node in self.nodes if results[node]]
+
+        def copy(source: Optional[str], target: str) -> bool:
+            try:
+                self._copy_to_node(filename, source, target)
+                self.logger.info(f"Copied {filename} from {source or self.host} to {target}")
+                return True
+            except Exception as e:
+                self.logger.error(f"Failed to copy {filename} from {source or self.host} to {target}: {str(e)}")
+                return False
+
+        if self.topology == 'chain':
+            source = holders[-1]
+            for target in missing:
+                results[target] = copy(source, target)
+                if not results[target]:
+                    break
+                source = target
+            return results
+
+        while missing:
+            pairs = list(zip(holders, missing))
+            with ThreadPoolExecutor(max_workers=len(pairs)) as executor:
+                copied = list(executor.map(lambda pair: copy(*pair), pairs))
+            for (_, target), ok in zip(pairs, copied):
+                results[target] = ok
+                if ok:
+                    holders.append(target)
+            missing = missing[len(pairs):]
+            if not any(copied):
+                break
+        return results
+
+    def distribute_images(self, filenames: List[str]) -> Dict[str, Dict[str, bool]]:
+        """
+        Replicate images from host to the other cluster nodes
+        
+        Images are uploaded over the WAN to host only once. The other nodes
+        receive them node to node with scp, driven through the SSH
+        connection to host, so nodes only need SSH key trust between each
+        other as set up by a Proxmox VE cluster.
+        
+        Args:
+            filenames: Names of images already present on host
+            
+        Returns:
+            Dict[str, Dict[str, bool]]: For every image, whether each node holds it
+        """
+        if not self.nodes or not filenames:
+            return {}
+        self.logger.info(f"Distributing {len(filenames)} images to {len(self.nodes)} nodes ({self.topology})")
+        with ThreadPoolExecutor(max_workers=min(self.parallel, len(filenames))) as executor:
+            return dict(zip(filenames, executor.map(self._distribute_image, filenames)))
@@ -0,0 +1,131 @@
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional
+import requests
+from utils.logger import Logger
+from utils.state import load_json, save_json
+
+
+class ParamSchema:
+    """Parameters of the VM create API call, taken from the schema of the PVE API viewer"""
+    logger = Logger.get_logger()
+
+    # API viewer script defining `const apiSchema = [...]`
+    APIDOC_URL = "https://{host}/pve-docs/api-viewer/apidoc.js"
+    CREATE_PATH = '/nodes/{node}/qemu'
+
+    def __init__(self, properties: Optional[Dict[str, dict]] = None):
+        """
+        Initialize parameter schema
+
+        Args:
+            properties: Parameter name to JSON schema of the create call, where
+                indexed parameters are named like `net[n]`. Without properties
+                every parameter is accepted and left to the API to validate.
+        """
+        self.properties = properties
+        self._indexed = {}
+        for name, prop in (properties or {}).items():
+            match = re.fullmatch(r'([a-z]+)\[n\]', name)
+            if match:
+                self._indexed[match.group(1)] = prop
+
+    @classmethod
+    def parse_apidoc(cls, script: str, path: str = CREATE_PATH, method: str = 'POST') -> Dict[str, dict]:
+        """
+        Extract the parameters of an API call from the API viewer script
+
+        Returns:
+            Dict[str, dict]: Parameter name to JSON schema
+        """
+        schema, _ = json.JSONDecoder().raw_decode(script, script.index('[', script.index('apiSchema')))
+        nodes = list(schema)
+        while nodes:
+            node = nodes.pop()
+            if node.get('path') == path:
+                return node['info'][method]['parameters']['properties']
+            nodes.extend(node.get('children') or [])
+        raise ValueError(f"API path {path} not found in schema")
+
+    @classmethod
+    def fetch(cls, host: str, verify_ssl: bool = False) -> Dict[str, dict]:
+        """Download the create call parameters from the API viewer of a host"""
+        if ':' not in host:
+            host = f"{host}:8006"
+        response = requests.get(cls.APIDOC_URL.format(host=host), verify=verify_ssl, timeout=30)
+        response.raise_for_status()
+        return cls.parse_apidoc(response.text)
+
+    @classmethod
+    def load(cls, proxmox, host: str, verify_ssl: bool, cache_path: Path) -> 'ParamSchema':
+        """
+        Load the schema of the host's PVE version, downloading it only after upgrades
+
+        Falls back to a permissive schema if it cannot be loaded.
+        """
+        try:
+            version = proxmox.version.get()['version']
+            cache = load_json(cache_path, {})
+            if cache.get('version') == version:
+                return cls(cache['properties'])
+
+            properties = cls.fetch(host, verify_ssl)
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            save_json(cache_path, {'version': version, 'properties': properties})
+            cls.logger.info(f"Cached VM create parameter schema of PVE {version}")
+            return cls(properties)
+        except Exception as e:
+            cls.logger.warning(f"Failed to load VM create parameter schema, parameters are not checked: {e}")
+            return cls()
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Get the schema of a parameter, indexed parameters such as net2 included"""
+        if key in self.properties:
+            return self.properties[key]
+        match = re.fullmatch(r'([a-z]+)(\d+)', key)
+        if match and match.group(1) in self._indexed:
+            return self._indexed[match.group(1)]
+        return None
+
+    @staticmethod
+    def convert(value: Any) -> Any:
+        """Convert a configuration value to the API representation"""
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+    def check(self, key: str, value: Any) -> Optional[str]:
+        """
+        Check a parameter against the schema
+
+        Only types, ranges and enumerations are checked, the API validates
+        property strings such as `virtio,bridge=vmbr0` itself.
+
+        Returns:
+            Optional[str]: Error message, None if the parameter is valid
+        """
+        if self.properties is None:
+            return None
+        prop = self.lookup(key)
+        if prop is None:
+            return f"unknown parameter {key}"
+
+        kind = prop.get('type')
+        if kind == 'boolean':
+            if value not in (True, False, 0, 1):
+                return f"{key} must be a boolean"
+        elif kind in ('integer', 'number'):
+            allowed = int if kind == 'integer' else (int, float)
+            if isinstance(value, bool) or not isinstance(value, allowed):
+                return f"{key} must be of type {kind}"
+            if 'minimum' in prop and value < prop['minimum']:
+                return f"{key} must be at least {prop['minimum']}"
+            if 'maximum' in prop and value > prop['maximum']:
+                return f"{key} must be at most {prop['maximum']}"
+        elif kind == 'string':
+            if 'enum' in prop and str(value) not in prop['enum']:
+                return f"{key} must be one of {prop['enum']}"
+            if 'maxLength' in prop and len(str(value)) > prop['maxLength']:
+                return f"{key} must be at most {prop['maxLength']} characters"
+        return None
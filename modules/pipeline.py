@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.logger import Logger
+from modules.image_manager import ImageManager
+from modules.pve_tools import ProxmoxVMManager
+
+
+class DeploymentPipeline:
+    """Create VMs as soon as their own images are uploaded while other uploads continue"""
+    logger = Logger.get_logger()
+
+    def __init__(self, vm_manager: ProxmoxVMManager, image_manager: ImageManager, reconcile: bool = False):
+        """
+        Initialize deployment pipeline
+
+        Args:
+            vm_manager: Manager creating the VMs
+            image_manager: Connected manager uploading the images
+            reconcile: Update existing VMs instead of failing them
+        """
+        self.vm_manager = vm_manager
+        self.image_manager = image_manager
+        self.reconcile = reconcile
+        self._uploaded: Dict[str, bool] = {}
+        self._condition = threading.Condition()
+        # Futures of async creations waiting for an upload, with their event loop
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _on_uploaded(self, image: str, success: bool):
+        """Record a finished upload and wake up the VM scheduler"""
+        with self._condition:
+            self._uploaded[image] = success
+            self._condition.notify_all()
+            for loop, future in self._async_waiters:
+                loop.call_soon_threadsafe(self._wake, future)
+            self._async_waiters = []
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        """Wake up an async creation waiting for an upload"""
+        if not future.done():
+            future.set_result(None)
+
+    def _upload(self, images: List[str], callback: Optional[Callable[[str, int, int], None]]):
+        """Upload images, then replicate every image on the host to the other cluster nodes"""
+        try:
+            results = self.image_manager.upload_images(images, callback=callback, overwrite=True,
+                                                       on_complete=self._on_uploaded)
+            # Images that were already on the host may still be missing on other nodes
+            failed = {img for img, ok in results.items() if not ok}
+            self.image_manager.distribute_images(
+                [img for img in self.image_manager.list_local_images() if img not in failed])
+        except Exception as e:
+            self.logger.error(f"Image upload failed: {str(e)}")
+        finally:
+            # Never leave the scheduler waiting for an upload that will not finish
+            for image in images:
+                if image not in self._uploaded:
+                    self._on_uploaded(image, False)
+
+    def upload_order(self, images: List[str]) -> List[str]:
+        """Order uploads so images needed by earlier VMs are sent first"""
+        first_use = {}
+        for index, vm_config in enumerate(self.vm_manager.config['vms']):
+            for image in self.vm_manager.image_dependencies(vm_config):
+                first_use.setdefault(image, index)
+        return sorted(images, key=lambda image: first_use.get(image, len(first_use) + 1))
+
+    def run(self, images: List[str],
+            callback: Optional[Callable[[str, int, int], None]] = None) -> Tuple[int, int]:
+        """
+        Upload images and create all configured VMs
+
+        Each VM is created as soon as every image it depends on and that is
+        part of this upload is present on the host, and the VMs it depends on
+        exist. VMs whose images are not being uploaded are created right away.
+        In async concurrency mode the VMs are created on the event loop of
+        the async client while the uploads run in their own thread.
+
+        Args:
+            images: Names of the images to upload
+            callback: Optional callback function for upload progress updates,
+                called with (filename, transferred_bytes, total_bytes)
+
+        Returns:
+            Tuple[int, int]: Number of VMs created successfully and failed,
+                nothing is uploaded or created if the preflight check fails
+        """
+        if not self.vm_manager.preflight(reconcile=self.reconcile):
+            return 0, len(self.vm_manager.config['vms'])
+
+        images = self.upload_order(images)
+        uploading = set(images)
+        uploader = threading.Thread(target=self._upload, args=(images, callback), daemon=True)
+        uploader.start()
+
+        success = 0
+        failed = 0
+        vms = self.vm_manager.config['vms']
+        total = len(vms)
+        self.logger.info(f"Starting creation of {total} virtual machines while uploading {len(images)} images "
+                         f"({self.vm_manager.max_in_flight} in flight at most)")
+
+        def create(idx: int, vm_config: dict) -> bool:
+            self.logger.info(f"\n[{idx}/{total}] Creating VM: {vm_config['name']} (ID: {vm_config['id']})")
+            if self.reconcile:
+                return self.vm_manager.apply_vm(vm_config)
+            return self.vm_manager.create_vm_limited(vm_config)
+
+        def uploaded(vm_config: dict) -> Tuple[bool, Optional[str]]:
+            # Called by the scheduler with the condition held
+            needed = self.vm_manager.image_dependencies(vm_config) & uploading
+            if not all(img in self._uploaded for img in needed):
+                return False, None
+            failed_images = [img for img in sorted(needed) if not self._uploaded[img]]
+            if failed_images:
+                return False, f"images failed to upload: {failed_images}"
+            return True, None
+
+        async def uploaded_async(vm_config: dict) -> Tuple[bool, Optional[str]]:
+            loop = asyncio.get_running_loop()
+            while True:
+                with self._condition:
+                    ready, error = uploaded(vm_config)
+                    if ready or error:
+                        return ready, error
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+                await future
+
+        # Reconciling always runs on threads, the async client only creates VMs
+        if self.vm_manager.concurrency_mode == 'async' and not self.reconcile:
+            results = self.vm_manager.create_vms_async(gate=uploaded_async)
+        else:
+            results = self.vm_manager.run_graph(vms, create, gate=uploaded, condition=self._condition)
+        for vm_config, result in zip(vms, results):
+            if result:
+                success += 1
+            else:
+                failed += 1
+                self.logger.error(f"VM {vm_config['name']} (ID: {vm_config['id']}) creation failed")
+
+        uploader.join()
+        self.vm_manager.finish_run()
+        self.logger.info(f"\nCreation completed: {self.vm_manager.run_summary(success, failed)}")
+        return success, failed
@@ -0,0 +1,157 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+from utils.logger import Logger
+from modules.image_manager import ImageManager
+from modules.pipeline import DeploymentPipeline
+from modules.pve_tools import ProxmoxVMManager
+
+
+class DeploymentPlanner:
+    """List the operations of an apply run and estimate its duration, without changing anything"""
+    logger = Logger.get_logger()
+
+    # Seconds assumed for a task kind without recorded durations
+    DEFAULT_TASK_SECONDS = {'qmcreate': 5.0, 'qmcreate-import': 120.0}
+    # Seconds of a synchronous API call, such as a config fetch or update
+    API_CALL_SECONDS = 0.2
+
+    def __init__(self, vm_manager: ProxmoxVMManager, image_manager: Optional[ImageManager] = None):
+        """
+        Initialize deployment planner
+
+        Args:
+            vm_manager: Manager whose configured VMs are planned
+            image_manager: Connected manager of the images, uploads are not
+                planned without it
+        """
+        self.vm_manager = vm_manager
+        self.image_manager = image_manager
+
+    def task_seconds(self, kind: str) -> float:
+        """Expected duration of a task kind, from recorded durations if there are any"""
+        expected = self.vm_manager.task_durations.expected(kind)
+        return expected if expected is not None else self.DEFAULT_TASK_SECONDS.get(kind, 5.0)
+
+    def _plan_uploads(self, operations: List[dict]) -> Tuple[Dict[str, float], bool]:
+        """
+        Add image uploads and remote copies to the operations
+
+        Returns:
+            Tuple[Dict[str, float], bool]: Estimated seconds from the start
+                until each uploaded image is on the host, and whether the
+                throughput was measured before
+        """
+        manager = self.image_manager
+        pending = manager.pending_uploads()
+        throughput = manager.expected_throughput()
+        for img, source in pending['copy'].items():
+            operations.append({'action': 'copy', 'target': img, 'detail': f"from {source} on the host",
+                               'bytes': manager.verify_image(img, local=True)[1], 'seconds': None})
+
+        ready = {}
+        elapsed = 0.0
+        pipeline = DeploymentPipeline(self.vm_manager, manager)
+        for img in pipeline.upload_order(pending['upload']):
+            size = manager.verify_image(img, local=True)[1] or 0
+            seconds = size / throughput if throughput else None
+            elapsed += seconds or 0.0
+            ready[img] = elapsed
+            operations.append({'action': 'upload', 'target': img, 'detail': f"via {manager.backend}",
+                               'bytes': size, 'seconds': seconds})
+        return ready, throughput is not None or not ready
+
+    def build(self) -> Optional[Dict[str, object]]:
+        """
+        Build the plan of an apply run from one cluster snapshot
+
+        VM tasks are scheduled like the run does, up to `max_in_flight` at a
+        time, each starting once the images it needs are uploaded and the
+        VMs it depends on are done.
+
+        Returns:
+            Optional[Dict]: None if the preflight check fails, otherwise:
+                operations: Planned operations with action, target, detail,
+                    bytes and estimated seconds, if known
+                upload_seconds: Estimated duration of all uploads
+                total_seconds: Estimated wall time of the whole run
+                estimated: Whether uploads and tasks were estimated from
+                    measurements of earlier runs
+        """
+        manager = self.vm_manager
+        if not manager.preflight(reconcile=True, dry_run=True):
+            return None
+
+        operations = []
+        ready, throughput_known = {}, True
+        if self.image_manager:
+            try:
+                ready, throughput_known = self._plan_uploads(operations)
+            except Exception as e:
+                self.logger.error(f"Failed to plan image uploads, planning the VMs only: {str(e)}")
+                operations = []
+        tasks_known = True
+
+        jobs = {}
+        for position, vm_config in enumerate(manager.config['vms']):
+            vmid = vm_config['id']
+            target = f"{vm_config['name']} (ID: {vmid})"
+            if manager.cluster_index.is_managed(vmid, manager.node):
+                unchanged = manager.applied_state.matches(vmid, manager.config_hash(vm_config))
+                if manager.trust_applied_state and unchanged:
+                    operations.append({'action': 'skip', 'target': target, 'detail': "unchanged since the last run",
+                                       'bytes': None, 'seconds': 0.0})
+                    continue
+                action, detail = 'update', "fetch config, update differing parameters"
+                seconds = 2 * self.API_CALL_SECONDS
+            else:
+                kind = manager._task_kind(vm_config)
+                tasks_known = tasks_known and manager.task_durations.expected(kind) is not None
+                action = 'import' if kind == 'qmcreate-import' else 'create'
+                images = sorted(manager.image_dependencies(vm_config))
+                detail = f"needs {', '.join(images)}" if images else ''
+                seconds = self.task_seconds(kind) + self.API_CALL_SECONDS
+
+            operations.append({'action': action, 'target': target, 'detail': detail,
+                               'bytes': None, 'seconds': seconds})
+            start = max([ready.get(img, 0.0) for img in manager.image_dependencies(vm_config)] + [0.0])
+            jobs[position] = (start, seconds)
+
+        # Schedule the VM tasks in dependency order on max_in_flight slots
+        graph, _ = manager.dependency_graph(manager.config['vms'])
+        slots = [0.0] * manager.max_in_flight
+        ends = {}
+        for position in manager.dependency_order(graph):
+            if position not in jobs:
+                continue
+            start, seconds = jobs[position]
+            start = max([start] + [ends.get(dep, 0.0) for dep in graph[position]])
+            slot_free = heapq.heappop(slots)
+            ends[position] = max(start, slot_free) + seconds
+            heapq.heappush(slots, ends[position])
+        finish = max(ends.values(), default=0.0)
+
+        upload_seconds = max(ready.values(), default=0.0)
+        return {
+            'operations': operations,
+            'upload_seconds': upload_seconds,
+            'total_seconds': max(finish, upload_seconds),
+            'estimated': throughput_known and tasks_known,
+        }
+
+    @staticmethod
+    def format(plan: Dict[str, object]) -> List[str]:
+        """Format a plan as lines of text"""
+        lines = []
+        counts = {}
+        for op in plan['operations']:
+            counts[op['action']] = counts.get(op['action'], 0) + 1
+            size = f"{op['bytes'] / 1024 ** 2:10.1f} MB" if op['bytes'] else ' ' * 13
+            seconds = f"{op['seconds']:8.1f}s" if op['seconds'] is not None else '       ?s'
+            lines.append(f"  {op['action']:<7} {op['target']:<32} {size} {seconds}  {op['detail']}")
+
+        lines.append("Summary: " + ', '.join(f"{count} {action}" for action, count in counts.items()))
+        lines.append(f"Estimated uploads: {plan['upload_seconds']:.0f}s, "
+                     f"estimated total wall time: {plan['total_seconds']:.0f}s")
+        if not plan['estimated']:
+            lines.append("Some estimates use defaults, there is no recorded throughput or task duration yet")
+        return lines
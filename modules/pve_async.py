@@ -0,0 +1,237 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+from utils.logger import Logger
+from modules.task_tracker import PollSchedule, TaskListPoller
+
+try:
+    import aiohttp
+except ImportError:  # the async client is optional
+    aiohttp = None
+
+
+def is_available() -> bool:
+    """Whether the async client can be used, it needs the optional aiohttp package"""
+    return aiohttp is not None
+
+
+class AsyncProxmoxClient:
+    """asyncio Proxmox VE API client for the calls used by ProxmoxVMManager"""
+    logger = Logger.get_logger()
+
+    def __init__(self, host: str, user: str, password: str, verify_ssl: bool = False,
+                 port: int = 8006, max_connections: int = 32):
+        """
+        Initialize async Proxmox client
+
+        Args:
+            host: PVE host IP or domain
+            user: API user, e.g. root@pam
+            password: API password
+            verify_ssl: Verify the server certificate (default: False)
+            port: API port (default: 8006)
+            max_connections: Maximum concurrent HTTP connections (default: 32)
+        """
+        if aiohttp is None:
+            raise ImportError("The async Proxmox client requires the aiohttp package")
+        self.base_url = f"https://{host}:{port}/api2/json"
+        self.user = user
+        self.password = password
+        self.verify_ssl = verify_ssl
+        self.max_connections = max_connections
+        self.session: Optional['aiohttp.ClientSession'] = None
+
+    async def __aenter__(self) -> 'AsyncProxmoxClient':
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=self.verify_ssl)
+        self.session = aiohttp.ClientSession(connector=connector)
+        try:
+            await self.login()
+        except BaseException:
+            await self.session.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.session.close()
+
+    async def login(self):
+        """Obtain an authentication ticket and CSRF token"""
+        async with self.session.post(f"{self.base_url}/access/ticket",
+                                     data={'username': self.user, 'password': self.password}) as response:
+            response.raise_for_status()
+            data = (await response.json())['data']
+        # Sent as a header, the cookie jar refuses cookies for IP address hosts
+        self.session.headers['Cookie'] = f"PVEAuthCookie={data['ticket']}"
+        self.session.headers['CSRFPreventionToken'] = data['CSRFPreventionToken']
+
+    @staticmethod
+    def _encode(params: Dict[str, Any]) -> Dict[str, str]:
+        """Encode parameter values the way the API expects them"""
+        return {key: str(int(value)) if isinstance(value, bool) else str(value)
+                for key, value in params.items() if value is not None}
+
+    async def request(self, method: str, path: str, **params) -> Any:
+        """
+        Send an API request
+
+        Args:
+            method: HTTP method
+            path: API path below /api2/json
+            **params: Query parameters for GET, form parameters otherwise
+
+        Returns:
+            The data member of the response
+        """
+        url = f"{self.base_url}{path}"
+        params = self._encode(params)
+        kwargs = {'params': params} if method == 'GET' else {'data': params}
+        async with self.session.request(method, url, **kwargs) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"{response.status} {response.reason}: {(await response.text()).strip()}")
+            return (await response.json()).get('data')
+
+    async def qemu_list(self, node: str) -> List[dict]:
+        """List VMs on a node"""
+        return await self.request('GET', f"/nodes/{node}/qemu")
+
+    async def qemu_create(self, node: str, **params) -> str:
+        """Create a VM and return the UPID of the creation task"""
+        return await self.request('POST', f"/nodes/{node}/qemu", **params)
+
+    async def qemu_config_put(self, node: str, vmid: int, **params):
+        """Update VM configuration"""
+        return await self.request('PUT', f"/nodes/{node}/qemu/{vmid}/config", **params)
+
+    async def task_status(self, node: str, upid: str) -> dict:
+        """Get the status of a task"""
+        return await self.request('GET', f"/nodes/{node}/tasks/{quote(upid, safe='')}/status")
+
+    async def wait_for_task(self, node: str, upid: str, timeout: int = 300,
+                            schedule: Optional[PollSchedule] = None,
+                            tracker: Optional['AsyncTaskTracker'] = None) -> bool:
+        """
+        Wait for task completion without blocking the event loop
+
+        Args:
+            node: Node running the task
+            upid: UPID of the task
+            timeout: Seconds to wait (default: 300)
+            schedule: Poll intervals of the task
+            tracker: Resolve the task from the task list polls shared by all
+                waiting tasks instead of polling its status
+
+        Returns:
+            bool: True if the task finished successfully
+        """
+        if tracker is not None:
+            task_status = await tracker.wait(upid, timeout, schedule)
+        else:
+            task_status = await self._poll_task(node, upid, timeout, schedule)
+        if task_status is None:
+            self.logger.error("Task timeout")
+            return False
+        if task_status['exitstatus'] == 'OK':
+            return True
+        self.logger.error(f"Task failed: {task_status}")
+        return False
+
+    async def _poll_task(self, node: str, upid: str, timeout: int,
+                         schedule: Optional[PollSchedule]) -> Optional[dict]:
+        """Poll the status of a single task until it stops, None on timeout"""
+        schedule = schedule or PollSchedule()
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < timeout:
+            await asyncio.sleep(schedule.next(time.monotonic() - start_time))
+            task_status = await self.task_status(node, upid)
+            if task_status['status'] == 'stopped':
+                return task_status
+        return None
+
+
+class AsyncTaskTracker(TaskListPoller):
+    """Track the tasks of an event loop with one task list request per poll interval"""
+    logger = Logger.get_logger()
+
+    def __init__(self, client: AsyncProxmoxClient, node: str, scope: str = 'node', limit: int = 1000):
+        """
+        Initialize async task tracker, within the running event loop
+
+        Args:
+            client: Logged in async client
+            node: Node running the tasks
+            scope: Poll the 'node' task list or the 'cluster' task list (default: 'node')
+            limit: Maximum number of tasks fetched per poll (default: 1000)
+        """
+        super().__init__(node, scope, limit)
+        self.client = client
+        self._poller: Optional[asyncio.Future] = None
+        self._wakeup = asyncio.Event()
+
+    async def wait(self, upid: str, timeout: float = 300,
+                   schedule: Optional[PollSchedule] = None) -> Optional[dict]:
+        """
+        Wait for a task to stop
+
+        Args:
+            upid: UPID of the task
+            timeout: Seconds to wait (default: 300)
+            schedule: Poll intervals of the task
+
+        Returns:
+            Optional[dict]: Final task status with 'status' and 'exitstatus',
+            None on timeout
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[upid] = self._new_waiter(schedule or PollSchedule(), future=future)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._run())
+        # The new task may need an earlier poll than the poller is sleeping for
+        self._wakeup.set()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiters.pop(upid, None)
+
+    async def _list_tasks(self, since: int) -> list:
+        """Fetch the task list covering every task started after `since`"""
+        self.api_calls += 1
+        if self.scope == 'cluster':
+            return await self.client.request('GET', "/cluster/tasks")
+        return await self.client.request('GET', f"/nodes/{self.node}/tasks",
+                                         source='all', since=since, limit=self.limit)
+
+    async def poll(self):
+        """Resolve every outstanding task from a single task list request"""
+        waiters = {upid: waiter for upid, waiter in self._waiters.items() if not waiter['future'].done()}
+        if not waiters:
+            return
+
+        finished, lookups = self._resolve(waiters, await self._list_tasks(self._since(waiters)))
+        for upid in lookups:
+            self.api_calls += 1
+            status = await self.client.task_status(self.node, upid)
+            if status['status'] == 'stopped':
+                finished[upid] = status
+        for upid, status in finished.items():
+            if not waiters[upid]['future'].done():
+                waiters[upid]['future'].set_result(status)
+
+    async def _run(self):
+        """Poll whenever the earliest outstanding task is due, until no task is being waited for"""
+        while self._waiters:
+            delay = self._next_poll() - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.poll()
+            except Exception as e:
+                self.logger.warning(f"Failed to poll task list: {e}")
+            self._advance()
@@ -1,11 +1,26 @@
 #!/usr/bin/env python3
 
+import asyncio
+import collections
+import contextlib
+import functools
+import posixpath
+import re
 import yaml
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.logger import Logger
+from modules.applied_state import AppliedState
+from modules.cluster_index import ClusterIndex
+from modules.param_schema import ParamSchema
+from modules.pve_async import AsyncProxmoxClient, AsyncTaskTracker, is_available as async_available
+from modules.reconcile import config_diff
+from modules.vmid_allocator import VmidAllocator
+from modules.task_tracker import PollSchedule, TaskDurations, TaskTracker, upid_type
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from proxmoxer import ProxmoxAPI
 from pprint import pformat
 import requests
@@ -16,6 +31,13 @@ requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
 
 class ProxmoxVMManager:
     logger = Logger.get_logger()
+
+    # Create parameters that a config update can set as well, they are moved
+    # to one after creation if the create call of the host rejects them
+    DEFERRABLE_PARAMS = {'tags', 'description', 'onboot', 'agent', 'protection', 'startup'}
+    # VM configuration keys handled by this tool instead of being passed to the API
+    LOCAL_KEYS = {'id', 'id_pool', 'cloud_init', 'ci', 'depends_on'}
+
     def __init__(self, config_path: str):
         """Initialize Proxmox VM Manager"""
         self.config_path = config_path
@@ -23,6 +45,55 @@ class ProxmoxVMManager:
         self.proxmox = self._connect_proxmox()
         self.node = self.config['proxmox']['node']
 
+        # Limits of concurrently running VM creations
+        concurrency = self.config.get('concurrency') or {}
+        self.max_in_flight = max(1, int(concurrency.get('max_in_flight', 1)))
+        self.concurrency_mode = concurrency.get('mode', 'threads')
+        if self.concurrency_mode not in ('threads', 'async'):
+            self.logger.error(f"Unsupported concurrency mode: {self.concurrency_mode}")
+            sys.exit(1)
+        if self.concurrency_mode == 'async' and not async_available():
+            self.logger.error("Concurrency mode async requires the aiohttp package")
+            sys.exit(1)
+        self._storage_limits = {
+            storage: max(1, int(limit))
+            for storage, limit in (concurrency.get('per_storage') or {}).items()
+        }
+        self._storage_slots = {storage: threading.Semaphore(limit)
+                               for storage, limit in self._storage_limits.items()}
+
+        # Task list polling shared by all waiting creations
+        tasks_config = self.config.get('tasks') or {}
+        self.state_dir = Path(self.config.get('state_dir', './state'))
+        self.task_durations = TaskDurations(self.state_dir / 'task_durations.json')
+        self.poll_schedule = {
+            'initial': tasks_config.get('initial_interval', 0.1),
+            'factor': tasks_config.get('backoff', 1.5),
+            'ceiling': tasks_config.get('poll_ceiling', 5.0),
+        }
+        self.vmid_allocator = VmidAllocator(self.state_dir / 'vmid_reservations.json',
+                                            self.config.get('id_pools'))
+        self.task_tracker = None
+        if tasks_config.get('tracking', 'batched') == 'batched':
+            self.task_tracker = TaskTracker(self.proxmox, self.node,
+                                            scope=tasks_config.get('scope', 'node'),
+                                            durations=self.task_durations,
+                                            schedule=self.poll_schedule)
+
+        # Existing VM IDs in the cluster, fetched once per run and kept current by the creations
+        self.cluster_index: Optional[ClusterIndex] = None
+        self._inventory: Optional[Set[int]] = None
+        self._inventory_lock = threading.RLock()
+        self.api_calls_saved = 0
+        self._deferred_params: Set[str] = set()
+        # Outcomes of reconciled VMs: created, updated, unchanged or skipped
+        self.reconcile_stats = collections.Counter()
+        # Reconciling skips VMs whose config was applied unchanged before
+        self.applied_state = AppliedState(self.state_dir / 'applied_state.json')
+        self.trust_applied_state = True
+        # Permissive until preflight loads the schema of the host
+        self.param_schema = ParamSchema()
+
     def _load_config(self) -> dict:
         """Load configuration file"""
         try:
@@ -47,6 +118,13 @@ class ProxmoxVMManager:
             if not all(field in vm for field in required_vm_fields):
                 self.logger.error(f"VM configuration {vm.get('name', 'Unknown')} missing required fields")
                 return False
+            # `id: auto` takes the next free ID of the VM's `id_pool`
+            if vm['id'] != 'auto' and not isinstance(vm['id'], int):
+                self.logger.error(f"VM configuration {vm['name']} has invalid id: {vm['id']}")
+                return False
+            if 'id_pool' in vm and vm['id'] != 'auto':
+                self.logger.error(f"VM configuration {vm['name']} sets id_pool without id: auto")
+                return False
         return True
 
     def _connect_proxmox(self) -> ProxmoxAPI:
@@ -63,29 +141,374 @@ class ProxmoxVMManager:
             self.logger.error(f"Failed to connect to Proxmox: {e}")
             sys.exit(1)
 
-    def _wait_for_task(self, task_upid: str, timeout: int = 300) -> bool:
+    @staticmethod
+    def _task_kind(vm_config: dict) -> str:
+        """Task kind of a VM creation, disk imports take much longer than plain creates"""
+        if any(isinstance(value, str) and 'import-from=' in value for value in vm_config.values()):
+            return 'qmcreate-import'
+        return 'qmcreate'
+
+    def _wait_for_task(self, task_upid: str, timeout: int = 300, kind: Optional[str] = None) -> bool:
         """Wait for task completion"""
+        if self.task_tracker:
+            task_status = self.task_tracker.wait(task_upid, timeout, kind=kind)
+            if task_status is None:
+                self.logger.error("Task timeout")
+                return False
+            if task_status['exitstatus'] == 'OK':
+                return True
+            self.logger.error(f"Task failed: {task_status}")
+            return False
+
+        kind = kind or upid_type(task_upid)
+        schedule = PollSchedule(expected=self.task_durations.expected(kind), **self.poll_schedule)
         start_time = time.time()
         while time.time() - start_time < timeout:
+            time.sleep(schedule.next(time.time() - start_time))
             task_status = self.proxmox.nodes(self.node).tasks(task_upid).status.get()
             if task_status['status'] == 'stopped':
                 if task_status['exitstatus'] == 'OK':
+                    self.task_durations.record(kind, time.time() - start_time)
                     return True
                 else:
                     self.logger.error(f"Task failed: {task_status}")
                     return False
-            time.sleep(1)
         self.logger.error("Task timeout")
         return False
 
-    def _validate_vm_config(self, vm_config: dict) -> bool:
-        """Validate VM configuration"""
-        # Check if VM ID already exists
-        existing_vms = self.proxmox.nodes(self.node).qemu.get()
-        if any(vm['vmid'] == vm_config['id'] for vm in existing_vms):
-            self.logger.error(f"VM ID {vm_config['id']} already exists")
+    @staticmethod
+    def image_dependencies(vm_config: dict) -> Set[str]:
+        """
+        Get the image files a VM needs on the host before it can be created
+
+        Images are taken from volumes in the iso content directory, such as
+        `ide2: local:iso/ikuai.iso,media=cdrom`, and from `import-from` disk
+        options, such as `scsi0: local-lvm:0,import-from=/path/openwrt.img`.
+
+        Returns:
+            Set[str]: Image file names
+        """
+        images = set()
+        for key, value in vm_config.items():
+            if not re.fullmatch(r'(ide|sata|scsi|virtio)\d+', key) or not isinstance(value, str):
+                continue
+            volume, *options = value.split(',')
+            storage_path = volume.split(':', 1)[-1]
+            if storage_path.startswith('iso/'):
+                images.add(posixpath.basename(storage_path))
+            for option in options:
+                name, _, path = option.partition('=')
+                if name == 'import-from':
+                    images.add(posixpath.basename(path.split(':', 1)[-1]))
+        return images
+
+    @staticmethod
+    def storage_dependencies(vm_config: dict) -> Set[str]:
+        """
+        Get the storages a VM allocates disks on
+
+        Returns:
+            Set[str]: Storage names, such as `local-lvm` for `scsi0: local-lvm:8`
+        """
+        storages = set()
+        for key, value in vm_config.items():
+            if not re.fullmatch(r'(ide|sata|scsi|virtio|efidisk|tpmstate)\d+', key) or not isinstance(value, str):
+                continue
+            volume, _, options = value.partition(',')
+            # CD-ROM images are only attached, nothing is allocated for them
+            if 'media=cdrom' in options.split(',') or volume.split(':', 1)[-1].startswith('iso/'):
+                continue
+            # Skip passed through devices such as /dev/sda
+            if ':' in volume and not volume.startswith('/'):
+                storages.add(volume.split(':', 1)[0])
+        return storages
+
+    @staticmethod
+    def dependency_graph(vms: List[dict]) -> Tuple[Dict[int, Set[int]], List[str]]:
+        """
+        Resolve the `depends_on` entries of VM configurations
+
+        A dependency names another VM of the configuration by name or ID,
+        as a single value or a list.
+
+        Returns:
+            Tuple[Dict[int, Set[int]], List[str]]: Positions of the VMs each
+                VM depends on, by position in vms, and error messages for
+                unknown or ambiguous references and dependency cycles
+        """
+        by_ref: Dict[object, List[int]] = collections.defaultdict(list)
+        for position, vm_config in enumerate(vms):
+            by_ref[vm_config['name']].append(position)
+            if vm_config['id'] != 'auto':
+                by_ref[vm_config['id']].append(position)
+
+        graph = {}
+        errors = []
+        for position, vm_config in enumerate(vms):
+            refs = vm_config.get('depends_on') or []
+            graph[position] = set()
+            for ref in refs if isinstance(refs, list) else [refs]:
+                targets = set(by_ref.get(ref, ()))
+                if len(targets) != 1:
+                    problem = 'unknown' if not targets else 'ambiguous'
+                    errors.append(f"VM {vm_config['name']} depends on {problem} VM {ref}")
+                elif targets == {position}:
+                    errors.append(f"VM {vm_config['name']} depends on itself")
+                else:
+                    graph[position] |= targets
+
+        if not errors and ProxmoxVMManager.dependency_order(graph) is None:
+            errors.append("VM dependencies contain a cycle")
+        return graph, errors
+
+    @staticmethod
+    def dependency_order(graph: Dict[int, Set[int]]) -> Optional[List[int]]:
+        """Order VM positions so every VM follows its dependencies, None if there is a cycle"""
+        remaining = {position: set(deps) for position, deps in graph.items()}
+        order = []
+        while remaining:
+            ready = sorted(position for position, deps in remaining.items() if not deps)
+            if not ready:
+                return None
+            for position in ready:
+                del remaining[position]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+            order.extend(ready)
+        return order
+
+    def run_graph(self, vms: List[dict], run: Callable[[int, dict], bool],
+                  gate: Optional[Callable[[dict], Tuple[bool, Optional[str]]]] = None,
+                  condition: Optional[threading.Condition] = None) -> List[bool]:
+        """
+        Run an operation for every VM once all VMs it depends on succeeded
+
+        Independent VMs run concurrently, up to `max_in_flight` at a time.
+        VMs whose dependencies failed are not run and count as failed.
+
+        Args:
+            vms: VM configurations, with acyclic dependencies
+            run: Called with (position starting at 1, VM configuration) in a
+                worker thread, returns success
+            gate: Optional check of other preconditions, such as uploaded
+                images, returning (ready, error), where an error fails the VM
+            condition: Condition notified when the gate may change, its lock
+                must be reentrant as in the default `threading.Condition()`
+
+        Returns:
+            List[bool]: Result of every VM, in configuration order
+        """
+        graph, _ = self.dependency_graph(vms)
+        condition = condition or threading.Condition()
+        results: List[Optional[bool]] = [None] * len(vms)
+        pending = list(range(len(vms)))
+        running = 0
+
+        def finished(position: int, future):
+            nonlocal running
+            try:
+                result = bool(future.result())
+            except Exception as e:
+                self.logger.error(f"Error occurred while processing VM: {e}")
+                result = False
+            with condition:
+                results[position] = result
+                running -= 1
+                condition.notify_all()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor, condition:
+            while pending or running:
+                progressed = False
+                for position in list(pending):
+                    vm_config = vms[position]
+                    deps = graph[position]
+                    failed_deps = [vms[dep]['name'] for dep in sorted(deps) if results[dep] is False]
+                    error = f"VMs it depends on failed: {failed_deps}" if failed_deps else None
+                    if not error and any(results[dep] is None for dep in deps):
+                        continue
+                    if not error and gate:
+                        ready, error = gate(vm_config)
+                        if not ready and not error:
+                            continue
+
+                    pending.remove(position)
+                    progressed = True
+                    if error:
+                        results[position] = False
+                        self.logger.error(f"[{position + 1}/{len(vms)}] VM {vm_config['name']} "
+                                          f"(ID: {vm_config['id']}) skipped, {error}")
+                        continue
+                    running += 1
+                    future = executor.submit(run, position + 1, vm_config)
+                    future.add_done_callback(functools.partial(finished, position))
+                # Skipped VMs may unblock or fail their dependents right away
+                if not progressed:
+                    condition.wait()
+        return [bool(result) for result in results]
+
+    def create_vm_limited(self, vm_config: dict) -> bool:
+        """Create virtual machine once a slot on every storage it uses is free"""
+        slots = [self._storage_slots[storage] for storage in sorted(self.storage_dependencies(vm_config))
+                 if storage in self._storage_slots]
+        # Acquire in sorted storage order so concurrent creations cannot deadlock
+        for slot in slots:
+            slot.acquire()
+        try:
+            return self.create_vm(vm_config)
+        finally:
+            for slot in reversed(slots):
+                slot.release()
+
+    def invalidate_inventory(self):
+        """Drop the cached VM inventory, the next lookup fetches it again"""
+        with self._inventory_lock:
+            self._inventory = None
+
+    def refresh_inventory(self) -> ClusterIndex:
+        """Fetch the VMs and containers of the whole cluster into the inventory"""
+        index = ClusterIndex.from_api(self.proxmox)
+        with self._inventory_lock:
+            self.cluster_index = index
+            self._inventory = index.vmids
+        return index
+
+    def allocate_vmids(self, vms: List[dict], index: ClusterIndex, reconcile: bool = False,
+                       reserve: bool = True):
+        """
+        Replace `id: auto` of VM configurations with free IDs of their pools
+
+        All IDs are allocated at once from the cluster snapshot and reserved
+        until `release_vmids`, so concurrent runs skip them. When reconciling,
+        a VM that already exists on the node under the same name keeps its ID.
+        Without reserve the IDs are only looked up, as for a plan.
+        """
+        auto = [vm for vm in vms if vm['id'] == 'auto']
+        if reconcile:
+            for vm in auto:
+                vmid = index.find_vm(vm['name'], self.node)
+                if vmid is not None:
+                    vm['id'] = vmid
+            auto = [vm for vm in auto if vm['id'] == 'auto']
+        if not auto:
+            return
+        taken = index.vmids | {vm['id'] for vm in vms if vm['id'] != 'auto'}
+        vmids = self.vmid_allocator.allocate(
+            [vm.get('id_pool', VmidAllocator.DEFAULT_POOL) for vm in auto], taken, reserve=reserve)
+        for vm, vmid in zip(auto, vmids):
+            vm['id'] = vmid
+            self.logger.info(f"Allocated VM ID {vmid} for {vm['name']}")
+
+    def release_vmids(self):
+        """Release the VM ID reservations of this run once its VMs exist or failed"""
+        try:
+            self.vmid_allocator.release()
+        except Exception as e:
+            self.logger.warning(f"Failed to release VM ID reservations: {e}")
+
+    def finish_run(self):
+        """Release VM ID reservations and save the applied config state"""
+        self.release_vmids()
+        try:
+            self.applied_state.save()
+        except Exception as e:
+            self.logger.warning(f"Failed to save applied config state: {e}")
+
+    def check_params(self, vms: List[dict]) -> List[str]:
+        """
+        Check the create parameters of VM configurations against the API schema
+
+        The schema of the host's PVE version is downloaded once and cached in
+        the state directory.
+
+        Returns:
+            List[str]: Error messages
+        """
+        if self.param_schema.properties is None:
+            proxmox_config = self.config['proxmox']
+            self.param_schema = ParamSchema.load(self.proxmox, proxmox_config['host'],
+                                                 proxmox_config['verify_ssl'],
+                                                 self.state_dir / 'qemu_create_schema.json')
+        errors = []
+        for vm_config in vms:
+            for key, value in self._prepare_create_params(vm_config).items():
+                error = self.param_schema.check(key, value)
+                if error:
+                    errors.append(f"VM {vm_config['name']} (ID: {vm_config['id']}): {error}")
+        return errors
+
+    def preflight(self, vms: Optional[List[dict]] = None, reconcile: bool = False,
+                  dry_run: bool = False) -> bool:
+        """
+        Check all VM configurations against the cluster before creating any
+
+        VMs with `id: auto` get their IDs allocated first.
+
+        Args:
+            vms: VM configurations to check, all configured VMs by default
+            reconcile: Accept VMs that already exist on the node, they are
+                updated instead of created
+            dry_run: Do not reserve allocated VM IDs
+
+        Returns:
+            bool: True if no VM ID conflicts with the cluster or another VM
+        """
+        vms = self.config['vms'] if vms is None else vms
+        try:
+            index = self.refresh_inventory()
+        except Exception as e:
+            self.logger.error(f"Failed to fetch cluster resources: {e}")
+            return False
+
+        try:
+            self.allocate_vmids(vms, index, reconcile=reconcile, reserve=not dry_run)
+        except Exception as e:
+            self.logger.error(f"Failed to allocate VM IDs: {e}")
             return False
 
+        errors, warnings = index.check(vms, reconcile_node=self.node if reconcile else None)
+        errors.extend(self.check_params(vms))
+        errors.extend(self.dependency_graph(vms)[1])
+        for warning in warnings:
+            self.logger.warning(warning)
+        for error in errors:
+            self.logger.error(error)
+        if errors:
+            self.logger.error(f"Preflight check failed with {len(errors)} errors, no VM was created")
+            if not dry_run:
+                self.release_vmids()
+            return False
+        self.applied_state.prune(index.vmids)
+        self.logger.info(f"Preflight check passed against {len(index.guests)} guests in the cluster")
+        return True
+
+    def _claim_vmid(self, vmid: int) -> bool:
+        """
+        Reserve a VM ID in the inventory for a creation
+
+        The inventory is fetched on first use only, later lookups are served
+        from the cache and counted in `api_calls_saved`.
+
+        Returns:
+            bool: False if a VM with this ID already exists or is being created
+        """
+        with self._inventory_lock:
+            if self._inventory is None:
+                self.refresh_inventory()
+            else:
+                self.api_calls_saved += 1
+            if int(vmid) in self._inventory:
+                return False
+            self._inventory.add(int(vmid))
+            return True
+
+    def _release_vmid(self, vmid: int):
+        """Return a claimed VM ID whose creation was never submitted"""
+        with self._inventory_lock:
+            if self._inventory is not None:
+                self._inventory.discard(int(vmid))
+
+    def _validate_vm_config(self, vm_config: dict) -> bool:
+        """Validate VM configuration"""
         # Validate required parameters
         required_params = ['id', 'name', 'memory', 'cores']
         if not all(param in vm_config for param in required_params):
@@ -93,6 +516,11 @@ class ProxmoxVMManager:
             self.logger.error(f"Missing required parameters: {missing}")
             return False
 
+        # Check if VM ID already exists
+        if not self._claim_vmid(vm_config['id']):
+            self.logger.error(f"VM ID {vm_config['id']} already exists")
+            return False
+
         return True
 
     def _prepare_create_params(self, vm_config: dict) -> dict:
@@ -104,18 +532,10 @@ class ProxmoxVMManager:
             'cores': vm_config['cores'],
         }
 
-        # Add optional basic parameters
-        optional_params = {
-            'sockets', 'ostype', 'scsihw', 'cpu', 'acpi', 'ide2',
-            'scsi0', 'scsi1', 'net0', 'net1', 'bios', 'machine'  # 添加 machine 到可选参数
-        }
-        for param in optional_params:
-            if param in vm_config:
-                create_params[param] = vm_config[param]
-
-        # Handle boot order
-        if 'boot' in vm_config:  # 支持直接指定 boot 参数
-            create_params['boot'] = vm_config['boot']
+        # Pass every other parameter on, preflight checks them against the API schema
+        for param, value in vm_config.items():
+            if param not in self.LOCAL_KEYS and param not in create_params:
+                create_params[param] = self.param_schema.convert(value)
 
         # Handle cloud-init configuration
         if vm_config.get('cloud_init') and 'ci' in vm_config:
@@ -129,16 +549,60 @@ class ProxmoxVMManager:
 
         return create_params
 
-    def _apply_post_create_config(self, vm_config: dict) -> bool:
+    def config_hash(self, vm_config: dict) -> str:
+        """Hash the normalized configuration of a VM"""
+        return self.applied_state.config_hash(self._prepare_create_params(vm_config))
+
+    def _split_create_params(self, vm_config: dict) -> Tuple[dict, dict]:
+        """
+        Prepare the parameters of the create call and of a follow-up config update
+
+        Everything goes into the create call, except parameters that an
+        earlier create call of this run rejected.
+
+        Returns:
+            Tuple[dict, dict]: Create parameters and post-creation parameters
+        """
+        create_params = self._prepare_create_params(vm_config)
+        post_params = {key: create_params.pop(key) for key in list(create_params)
+                       if key in self._deferred_params}
+        return create_params, post_params
+
+    @staticmethod
+    def _rejected_params(error: Exception, params: dict) -> Set[str]:
+        """Get the parameters named by a parameter verification error of the API"""
+        errors = getattr(error, 'errors', None)
+        if isinstance(errors, dict):
+            return set(errors) & set(params)
+        message = str(error)
+        if 'verification failed' not in message.lower():
+            return set()
+        return {key for key in params if re.search(rf"[\s'\"{{]{re.escape(key)}['\"]?\s*:", message)}
+
+    def _defer_rejected_params(self, error: Exception, create_params: dict, post_params: dict) -> bool:
+        """
+        Move parameters rejected by the create call to the post-creation update
+
+        Returns:
+            bool: True if the create call may succeed when retried without them
+        """
+        rejected = self._rejected_params(error, create_params)
+        if not rejected or not rejected <= self.DEFERRABLE_PARAMS:
+            return False
+        self.logger.warning(f"Create call rejected {sorted(rejected)}, applying them after creation")
+        self._deferred_params |= rejected
+        for key in rejected:
+            post_params[key] = create_params.pop(key)
+        return True
+
+    def _apply_post_create_config(self, vm_config: dict, params: dict) -> bool:
         """Apply post-creation configuration"""
         try:
             vmid = vm_config['id']
 
-            # Set tags
-            if 'tags' in vm_config:
-                self.proxmox.nodes(self.node).qemu(vmid).config.put(
-                    tags=vm_config['tags']
-                )
+            # Set parameters the create call did not accept
+            if params:
+                self.proxmox.nodes(self.node).qemu(vmid).config.put(**params)
 
             self.logger.info(f"VM {vm_config['name']} (ID: {vmid}) created successfully")
             return True
@@ -177,45 +641,257 @@ class ProxmoxVMManager:
 
     def create_vm(self, vm_config: dict) -> bool:
         """Create virtual machine"""
+        submitted = False
         try:
             # Validate VM configuration
             if not self._validate_vm_config(vm_config):
                 return False
 
             # Prepare creation parameters
-            create_params = self._prepare_create_params(vm_config)
+            create_params, post_params = self._split_create_params(vm_config)
             self.logger.info(f"VM creation parameters:\n{pformat(create_params)}")
 
             # Create VM
             self.logger.info(f"Starting VM creation: {vm_config['name']} (ID: {vm_config['id']})")
-            result = self.proxmox.nodes(self.node).qemu.create(**create_params)
-
-            if not self._wait_for_task(result):
+            submitted = True
+            try:
+                result = self.proxmox.nodes(self.node).qemu.create(**create_params)
+            except Exception as e:
+                if not self._defer_rejected_params(e, create_params, post_params):
+                    raise
+                result = self.proxmox.nodes(self.node).qemu.create(**create_params)
+
+            if not self._wait_for_task(result, kind=self._task_kind(vm_config)):
+                # The failed task may have left the VM behind
+                self.invalidate_inventory()
                 return False
 
             # Apply post-creation configuration
-            return self._apply_post_create_config(vm_config)
+            if not self._apply_post_create_config(vm_config, post_params):
+                return False
+            self.applied_state.record(vm_config['id'], self.config_hash(vm_config))
+            return True
 
         except Exception as e:
             self.logger.error(f"Error occurred while creating VM: {e}")
+            if submitted:
+                self.invalidate_inventory()
+            elif 'id' in vm_config:
+                self._release_vmid(vm_config['id'])
+            return False
+
+    def apply_vm(self, vm_config: dict) -> bool:
+        """
+        Bring a VM in line with its configuration
+
+        A VM that does not exist is created. Of an existing VM only the
+        parameters that differ from its current config are updated, with
+        the config digest guarding against concurrent changes. Existing VMs
+        whose configuration was applied unchanged before are skipped without
+        any API call, unless `trust_applied_state` is off.
+        """
+        vmid = vm_config['id']
+        config_hash = self.config_hash(vm_config)
+        if not (self.cluster_index and self.cluster_index.is_managed(vmid, self.node)):
+            if not self.create_vm_limited(vm_config):
+                return False
+            with self._inventory_lock:
+                self.reconcile_stats['created'] += 1
+            return True
+
+        if self.trust_applied_state and self.applied_state.matches(vmid, config_hash):
+            self.logger.info(f"VM {vm_config['name']} (ID: {vmid}) is unchanged since the last run")
+            with self._inventory_lock:
+                self.reconcile_stats['skipped'] += 1
+            return True
+
+        try:
+            current = self.proxmox.nodes(self.node).qemu(vmid).config.get()
+            recorded_digest = self.applied_state.digest(vmid)
+            if recorded_digest and current.get('digest') != recorded_digest:
+                self.logger.warning(f"VM {vm_config['name']} (ID: {vmid}) was changed outside of this tool")
+            changes = config_diff(self._prepare_create_params(vm_config), current)
+            if changes:
+                self.logger.info(f"Updating VM {vm_config['name']} (ID: {vmid}): {sorted(changes)}")
+                if current.get('digest'):
+                    changes['digest'] = current['digest']
+                self.proxmox.nodes(self.node).qemu(vmid).config.put(**changes)
+            else:
+                self.logger.info(f"VM {vm_config['name']} (ID: {vmid}) is up to date")
+            # The digest seen is stale once the update changed the config
+            self.applied_state.record(vmid, config_hash, None if changes else current.get('digest'))
+            with self._inventory_lock:
+                self.reconcile_stats['updated' if changes else 'unchanged'] += 1
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to update VM {vm_config['name']} (ID: {vmid}): {e}")
             return False
 
-    def create_all_vms(self) -> tuple[int, int]:
-        """Create all configured virtual machines"""
+    def run_summary(self, success: int, failed: int) -> str:
+        """Describe the outcome of a run for the final log line"""
+        summary = f"{success} successful, {failed} failed"
+        if self.reconcile_stats:
+            summary += ' (' + ', '.join(f"{self.reconcile_stats[outcome]} {outcome}"
+                                        for outcome in ('created', 'updated', 'unchanged', 'skipped')) + ')'
+        return summary + f", {self.api_calls_saved} inventory API calls saved"
+
+    def create_all_vms(self, reconcile: bool = False) -> tuple[int, int]:
+        """
+        Create all configured virtual machines
+
+        Args:
+            reconcile: Update existing VMs to their configuration instead of
+                failing them, see `apply_vm`
+        """
         success = 0
         failed = 0
         total = len(self.config['vms'])
 
-        self.logger.info(f"Starting creation of {total} virtual machines")
+        if not self.preflight(reconcile=reconcile):
+            return 0, total
 
-        for idx, vm_config in enumerate(self.config['vms'], 1):
+        self.logger.info(f"Starting {'apply' if reconcile else 'creation'} of {total} virtual machines "
+                         f"({self.max_in_flight} in flight at most)")
+
+        def create(idx: int, vm_config: dict) -> bool:
+            if reconcile:
+                self.logger.info(f"\n[{idx}/{total}] Applying VM: {vm_config['name']} (ID: {vm_config['id']})")
+                return self.apply_vm(vm_config)
             self.logger.info(f"\n[{idx}/{total}] Creating VM: {vm_config['name']} (ID: {vm_config['id']})")
+            return self.create_vm_limited(vm_config)
+
+        # Reconciling always runs on threads, the async client only creates VMs
+        if self.concurrency_mode == 'async' and not reconcile:
+            results = self.create_vms_async()
+        else:
+            results = self.run_graph(self.config['vms'], create)
 
-            if self.create_vm(vm_config):
+        for vm_config, result in zip(self.config['vms'], results):
+            if result:
                 success += 1
             else:
                 failed += 1
-                self.logger.error(f"VM {vm_config['name']} (ID: {vm_config['id']}) creation failed")
+                self.logger.error(f"VM {vm_config['name']} (ID: {vm_config['id']}) "
+                                  f"{'apply' if reconcile else 'creation'} failed")
 
-        self.logger.info(f"\nCreation completed: {success} successful, {failed} failed")
+        self.finish_run()
+        self.logger.info(f"\nCreation completed: {self.run_summary(success, failed)}")
         return success, failed
+
+    async def _create_vm_async(self, client: AsyncProxmoxClient, vm_config: dict,
+                               tracker: Optional[AsyncTaskTracker] = None) -> bool:
+        """Create virtual machine through the async client, waiting for its task through the tracker if given"""
+        submitted = False
+        try:
+            vmid = vm_config['id']
+            if not self._claim_vmid(vmid):
+                self.logger.error(f"VM ID {vmid} already exists")
+                return False
+
+            create_params, post_params = self._split_create_params(vm_config)
+            self.logger.info(f"VM creation parameters:\n{pformat(create_params)}")
+            submitted = True
+            try:
+                upid = await client.qemu_create(self.node, **create_params)
+            except Exception as e:
+                if not self._defer_rejected_params(e, create_params, post_params):
+                    raise
+                upid = await client.qemu_create(self.node, **create_params)
+            kind = self._task_kind(vm_config)
+            schedule = PollSchedule(expected=self.task_durations.expected(kind), **self.poll_schedule)
+            start_time = time.time()
+            if not await client.wait_for_task(self.node, upid, schedule=schedule, tracker=tracker):
+                self.invalidate_inventory()
+                return False
+            self.task_durations.record(kind, time.time() - start_time)
+
+            if post_params:
+                await client.qemu_config_put(self.node, vmid, **post_params)
+            self.applied_state.record(vmid, self.config_hash(vm_config))
+            self.logger.info(f"VM {vm_config['name']} (ID: {vmid}) created successfully")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error occurred while creating VM: {e}")
+            if submitted:
+                self.invalidate_inventory()
+            elif 'id' in vm_config:
+                self._release_vmid(vm_config['id'])
+            return False
+
+    def create_vms_async(self,
+                         gate: Optional[Callable[[dict], Awaitable[Tuple[bool, Optional[str]]]]] = None) -> List[bool]:
+        """
+        Create all configured virtual machines through the async client
+
+        Args:
+            gate: Optional coroutine function waiting for other preconditions,
+                such as uploaded images, returning (ready, error) once the VM
+                may be created or has failed
+
+        Returns:
+            List[bool]: Creation result of every VM, in configuration order
+        """
+        try:
+            return asyncio.run(self._create_all_vms_async(gate))
+        except Exception as e:
+            self.logger.error(f"Async VM creation failed: {e}")
+            return [False] * len(self.config['vms'])
+
+    async def _create_all_vms_async(self, gate=None) -> List[bool]:
+        """
+        Create all configured virtual machines on a single event loop
+
+        Creations and task polls are multiplexed over one HTTP connection
+        pool, limited by the same global and per-storage limits as the
+        thread pool. Each creation waits for the VMs it depends on. With
+        batched task tracking, all creation tasks are resolved from shared
+        task list polls.
+
+        Args:
+            gate: Optional coroutine function waiting for other preconditions,
+                see `create_vms_async`
+
+        Returns:
+            List[bool]: Creation result of every VM, in configuration order
+        """
+        proxmox_config = self.config['proxmox']
+        total = len(self.config['vms'])
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        storage_slots = {storage: asyncio.Semaphore(limit) for storage, limit in self._storage_limits.items()}
+
+        async with AsyncProxmoxClient(proxmox_config['host'], proxmox_config['user'],
+                                      proxmox_config['password'], verify_ssl=proxmox_config['verify_ssl'],
+                                      max_connections=self.max_in_flight) as client:
+            tracker = None
+            if self.task_tracker:
+                tracker = AsyncTaskTracker(client, self.node, scope=self.task_tracker.scope,
+                                           limit=self.task_tracker.limit)
+
+            graph, _ = self.dependency_graph(self.config['vms'])
+            tasks = {}
+
+            async def create(idx: int, vm_config: dict) -> bool:
+                deps = sorted(graph[idx - 1])
+                dep_results = [await tasks[dep] for dep in deps]
+                if not all(dep_results):
+                    failed_deps = [self.config['vms'][dep]['name'] for dep, ok in zip(deps, dep_results) if not ok]
+                    self.logger.error(f"[{idx}/{total}] VM {vm_config['name']} (ID: {vm_config['id']}) skipped, "
+                                      f"VMs it depends on failed: {failed_deps}")
+                    return False
+                if gate:
+                    ready, error = await gate(vm_config)
+                    if not ready:
+                        self.logger.error(f"[{idx}/{total}] VM {vm_config['name']} (ID: {vm_config['id']}) "
+                                          f"skipped, {error}")
+                        return False
+                async with in_flight, contextlib.AsyncExitStack() as stack:
+                    # Acquire in sorted storage order so concurrent creations cannot deadlock
+                    for storage in sorted(self.storage_dependencies(vm_config)):
+                        if storage in storage_slots:
+                            await stack.enter_async_context(storage_slots[storage])
+                    self.logger.info(f"\n[{idx}/{total}] Creating VM: {vm_config['name']} (ID: {vm_config['id']})")
+                    return await self._create_vm_async(client, vm_config, tracker)
+
+            for idx, vm_config in enumerate(self.config['vms'], 1):
+                tasks[idx - 1] = asyncio.ensure_future(create(idx, vm_config))
+            return await asyncio.gather(*(tasks[position] for position in range(total)))
@@ -0,0 +1,195 @@
+import os
+import posixpath
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+import logging
+import requests
+
+
+class MultipartFileStream:
+    """File-like multipart/form-data body that streams a file from disk"""
+
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, fields: Dict[str, str], file_field: str, file_path: Path,
+                 filename: str, callback: Optional[Callable[[int, int], None]] = None):
+        """
+        Initialize multipart body
+
+        Args:
+            fields: Plain form fields sent before the file
+            file_field: Form field name of the file part
+            file_path: Path of the file to stream
+            filename: File name announced in the file part
+            callback: Optional callback function for progress updates,
+                called with (transferred_bytes, total_bytes)
+        """
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        preamble = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        preamble += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n')
+        self._parts = [preamble.encode(), None, f'\r\n--{boundary}--\r\n'.encode()]
+        self._file = open(file_path, 'rb')
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        self._transferred = 0
+        self._callback = callback
+
+    def __len__(self) -> int:
+        return len(self._parts[0]) + self._file_size + len(self._parts[2])
+
+    def __iter__(self) -> Iterator[bytes]:
+        for block in iter(lambda: self.read(self.BLOCK_SIZE), b''):
+            yield block
+
+    def read(self, size: int = -1) -> bytes:
+        """Read the next part of the body"""
+        if size is None or size < 0:
+            size = len(self)
+        while self._parts:
+            part = self._parts[0]
+            if part is None:
+                data = self._file.read(size)
+                if data:
+                    self._transferred += len(data)
+                    if self._callback:
+                        self._callback(self._transferred, self._file_size)
+                    return data
+                self._file.close()
+            elif part:
+                self._parts[0] = part[size:]
+                return part[:size]
+            self._parts.pop(0)
+        return b''
+
+    def close(self):
+        """Close the streamed file"""
+        self._file.close()
+
+
+class ProxmoxUploader:
+    """Upload files to Proxmox VE storage through the HTTP API"""
+
+    # Subdirectory of a directory storage holding each content type
+    CONTENT_DIRS = {'iso': 'template/iso', 'vztmpl': 'template/cache', 'import': 'import'}
+
+    def __init__(self, host: str, user: str, password: str, node: str,
+                 storage: str = 'local', verify_ssl: bool = False, port: int = 8006):
+        """
+        Initialize Proxmox uploader
+
+        Args:
+            host: PVE host IP or domain
+            user: API user, e.g. root@pam
+            password: API password
+            node: Node owning the storage
+            storage: Storage receiving the uploads (default: local)
+            verify_ssl: Verify the server certificate (default: False)
+            port: API port (default: 8006)
+        """
+        self.base_url = f"https://{host}:{port}/api2/json"
+        self.user = user
+        self.password = password
+        self.node = node
+        self.storage = storage
+        self.session = requests.Session()
+        self.session.verify = verify_ssl
+        self.logger = logging.getLogger('ProxmoxManager')
+        self._authenticated = False
+
+    def _login(self):
+        """Obtain an authentication ticket and CSRF token"""
+        response = self.session.post(f"{self.base_url}/access/ticket",
+                                     data={'username': self.user, 'password': self.password})
+        response.raise_for_status()
+        data = response.json()['data']
+        self.session.cookies.set('PVEAuthCookie', data['ticket'])
+        self.session.headers['CSRFPreventionToken'] = data['CSRFPreventionToken']
+        self._authenticated = True
+
+    def _request(self, method: str, path: str, **kwargs):
+        """Send an authenticated API request and return its data"""
+        if not self._authenticated:
+            self._login()
+        response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        if not response.ok:
+            raise RuntimeError(f"API request {method} {path} failed ({response.status_code}): {response.text.strip()}")
+        return response.json().get('data')
+
+    def _wait_for_task(self, upid: str, timeout: int = 3600) -> bool:
+        """Wait for the task moving an uploaded file into the storage"""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            status = self._request('GET', f"/nodes/{self.node}/tasks/{upid}/status")
+            if status['status'] == 'stopped':
+                if status.get('exitstatus') == 'OK':
+                    return True
+                self.logger.error(f"Upload task failed: {status}")
+                return False
+            time.sleep(1)
+        self.logger.error("Upload task timeout")
+        return False
+
+    def upload(self, file_path: Path, filename: str,
+               callback: Optional[Callable[[int, int], None]] = None, content: str = 'iso') -> bool:
+        """
+        Upload a file to storage without buffering it in memory
+
+        Args:
+            file_path: Local file to upload
+            filename: Name of the file on the storage
+            callback: Optional callback function for progress updates,
+                called with (transferred_bytes, total_bytes)
+            content: Storage content type (default: iso)
+
+        Returns:
+            bool: True if the file was stored successfully
+        """
+        body = MultipartFileStream({'content': content}, 'filename', file_path, filename, callback)
+        try:
+            upid = self._request('POST', f"/nodes/{self.node}/storage/{self.storage}/upload",
+                                 data=body, headers={'Content-Type': body.content_type})
+        finally:
+            body.close()
+        return self._wait_for_task(upid)
+
+    def storage_dir(self, content: str = 'iso') -> Optional[str]:
+        """
+        Get the directory on the node that receives uploads of a content type
+
+        Returns:
+            Optional[str]: Directory path, None if the storage has no local path
+        """
+        config = self._request('GET', f"/storage/{self.storage}")
+        if not config or not config.get('path'):
+            return None
+        return posixpath.join(config['path'], self.CONTENT_DIRS[content])
+
+    def list_files(self, content: str = 'iso') -> Dict[str, Optional[int]]:
+        """
+        List the files of a content type on the storage
+
+        Returns:
+            Dict[str, Optional[int]]: File name to size in bytes
+        """
+        entries = self._request('GET', f"/nodes/{self.node}/storage/{self.storage}/content",
+                                params={'content': content})
+        # Volume IDs look like `local:iso/name.iso`
+        return {entry['volid'].split('/', 1)[-1]: entry.get('size') for entry in entries or []}
+
+    def delete(self, filename: str, content: str = 'iso') -> bool:
+        """
+        Delete a file from the storage
+
+        Returns:
+            bool: True if the file was deleted
+        """
+        upid = self._request('DELETE', f"/nodes/{self.node}/storage/{self.storage}/content/"
+                                       f"{self.storage}:{content}/{filename}")
+        # Recent PVE versions delete in a task, older ones synchronously
+        return self._wait_for_task(upid) if upid else True
@@ -0,0 +1,117 @@
+import re
+from typing import Any, Dict, Optional
+from urllib.parse import unquote
+from modules.cluster_index import ClusterIndex
+
+# Parameters the API never returns in readable form
+WRITE_ONLY_PARAMS = {'cipassword'}
+# Parameters that cannot change after creation
+CREATE_ONLY_PARAMS = {'vmid'}
+DISK_KEY = re.compile(r'(ide|sata|scsi|virtio|efidisk|tpmstate)\d+')
+NET_KEY = re.compile(r'net\d+')
+
+
+def parse_property_string(value: str) -> Dict[str, Optional[str]]:
+    """Parse a property string such as `virtio,bridge=vmbr0` into option to value, None for flags"""
+    options = {}
+    for part in str(value).split(','):
+        name, sep, option_value = part.partition('=')
+        options[name.strip()] = option_value if sep else None
+    return options
+
+
+def format_property_string(options: Dict[str, Optional[str]]) -> str:
+    """Format options parsed by `parse_property_string` back into a property string"""
+    return ','.join(name if value is None else f"{name}={value}" for name, value in options.items())
+
+
+def merge_property_string(key: str, desired: str, actual: str) -> str:
+    """
+    Apply the options of a desired property string to the actual one
+
+    Options the API filled in are kept. A leading value without a name,
+    such as the volume of a disk or the model of a NIC, replaces the
+    leading option of the actual value. A NIC keeps its MAC address, PVE
+    would otherwise generate a new one for `virtio,bridge=vmbr0`.
+    """
+    merged = parse_property_string(actual)
+    wanted = parse_property_string(desired)
+    leading, leading_value = next(iter(wanted.items()))
+    current, current_value = next(iter(merged.items()))
+    if leading_value is None and leading != current:
+        value = current_value if NET_KEY.fullmatch(key) else None
+        merged = {leading: value, **{name: v for name, v in merged.items() if name != current}}
+        del wanted[leading]
+        # The size belongs to the volume that was replaced
+        if DISK_KEY.fullmatch(key):
+            merged.pop('size', None)
+
+    for name, value in wanted.items():
+        # A bare option such as the NIC model keeps the value the API set, the MAC address
+        if value is None and merged.get(name) is not None:
+            continue
+        merged[name] = value
+    return format_property_string(merged)
+
+
+def is_allocation(value: Any) -> bool:
+    """Whether a disk value allocates or imports a new volume, such as `local-lvm:8`"""
+    volume, _, options = str(value).partition(',')
+    return bool(re.fullmatch(r'[\w.-]+:\d+(\.\d+)?', volume)) or 'import-from=' in options
+
+
+def values_match(key: str, desired: Any, actual: Any) -> bool:
+    """
+    Compare a desired parameter with the value the API returned
+
+    Property strings match if every option of the desired value is set
+    the same way in the actual value. The API adds defaults, such as the
+    MAC address in `virtio=BC:24:11:..,bridge=vmbr0`, and those are ignored.
+    """
+    if isinstance(desired, bool):
+        desired = int(desired)
+    if key == 'tags':
+        return sorted(ClusterIndex.split_tags(desired)) == sorted(ClusterIndex.split_tags(actual))
+    if key == 'sshkeys':
+        return unquote(str(actual)).strip() == str(desired).strip()
+    if str(desired) == str(actual):
+        return True
+    if not isinstance(desired, str) or '=' not in desired + str(actual):
+        return False
+
+    actual_options = parse_property_string(actual)
+    for name, value in parse_property_string(desired).items():
+        if name not in actual_options or (value is not None and actual_options[name] != value):
+            return False
+    return True
+
+
+def config_diff(desired: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the parameters a config update has to set to reach the desired config
+
+    Parameters missing from the desired config are left alone. Disks that
+    exist are never replaced, a desired allocation like `local-lvm:8` only
+    counts if the disk is missing. Changed property strings are merged
+    into the actual ones, see `merge_property_string`.
+
+    Args:
+        desired: Create parameters of the VM
+        actual: VM config returned by the API
+
+    Returns:
+        Dict[str, Any]: Parameters to update
+    """
+    changes = {}
+    for key, value in desired.items():
+        if key in WRITE_ONLY_PARAMS or key in CREATE_ONLY_PARAMS:
+            continue
+        if key not in actual:
+            changes[key] = value
+        elif DISK_KEY.fullmatch(key) and is_allocation(value):
+            continue
+        elif not values_match(key, value, actual[key]):
+            if isinstance(value, str) and '=' in str(actual[key]) and key not in ('tags', 'sshkeys'):
+                value = merge_property_string(key, value, str(actual[key]))
+            changes[key] = value
+    return changes
@@ -0,0 +1,271 @@
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from utils.logger import Logger
+from utils.state import load_json, save_json
+
+
+def upid_starttime(upid: str) -> int:
+    """Get the start time encoded in a task UPID (UPID:node:pid:pstart:starttime:type:id:user:)"""
+    try:
+        return int(upid.split(':')[4], 16)
+    except (IndexError, ValueError):
+        return 0
+
+
+def upid_type(upid: str) -> str:
+    """Get the task type encoded in a task UPID, such as qmcreate"""
+    try:
+        return upid.split(':')[5]
+    except IndexError:
+        return 'unknown'
+
+
+class TaskDurations:
+    """Persist recent task durations per task kind to predict how long tasks take"""
+
+    # Durations kept per task kind
+    MAX_SAMPLES = 20
+
+    def __init__(self, path: Path):
+        """
+        Initialize task duration history
+
+        Args:
+            path: Path of the JSON history file
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, list] = load_json(self.path, {})
+
+    def expected(self, kind: str) -> Optional[float]:
+        """Median recorded duration in seconds of a task kind, None if never recorded"""
+        with self._lock:
+            samples = self._samples.get(kind)
+            return statistics.median(samples) if samples else None
+
+    def record(self, kind: str, seconds: float):
+        """Record the duration of a finished task"""
+        with self._lock:
+            samples = self._samples.setdefault(kind, [])
+            samples.append(round(seconds, 3))
+            del samples[:-self.MAX_SAMPLES]
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                save_json(self.path, self._samples)
+            except OSError as e:
+                Logger.get_logger().warning(f"Failed to save task durations: {e}")
+
+
+class PollSchedule:
+    """
+    Poll intervals for one task
+
+    Intervals start short and grow geometrically up to a ceiling. If the
+    task kind has an expected duration, the first wait skips ahead to
+    shortly before the task is expected to finish, bounded by the ceiling.
+    """
+
+    def __init__(self, initial: float = 0.1, factor: float = 1.5, ceiling: float = 5.0,
+                 expected: Optional[float] = None):
+        """
+        Initialize poll schedule
+
+        Args:
+            initial: First poll interval in seconds (default: 0.1)
+            factor: Growth factor of consecutive intervals (default: 1.5)
+            ceiling: Maximum poll interval in seconds (default: 5.0)
+            expected: Expected task duration in seconds
+        """
+        self.interval = initial
+        self.factor = factor
+        self.ceiling = ceiling
+        self.expected = expected
+
+    def next(self, elapsed: float) -> float:
+        """Seconds to wait before the next poll, given seconds elapsed since the task started"""
+        if self.expected and elapsed < self.expected * 0.8:
+            return min(self.expected * 0.8 - elapsed, self.ceiling)
+        interval = self.interval
+        self.interval = min(self.interval * self.factor, self.ceiling)
+        return interval
+
+
+class TaskListPoller:
+    """
+    Resolve waiting tasks from task list snapshots, shared by the thread
+    and asyncio trackers which only differ in how they wait and fetch
+    """
+
+    # Polls a task may be missing from the task list before it is queried directly
+    MAX_MISSES = 3
+
+    def __init__(self, node: str, scope: str = 'node', limit: int = 1000):
+        """
+        Initialize task list poller
+
+        Args:
+            node: Node running the tasks
+            scope: Poll the 'node' task list or the 'cluster' task list (default: 'node')
+            limit: Maximum number of tasks fetched per poll (default: 1000)
+        """
+        if scope not in ('node', 'cluster'):
+            raise ValueError(f"Unsupported task tracking scope: {scope}")
+        self.node = node
+        self.scope = scope
+        self.limit = limit
+        self.api_calls = 0
+        self._waiters: Dict[str, dict] = {}
+
+    @staticmethod
+    def _new_waiter(schedule: PollSchedule, **extra) -> dict:
+        """Create the state of a task being waited for, polled first as its schedule says"""
+        start_time = time.monotonic()
+        return dict(extra, misses=0, start=start_time, schedule=schedule,
+                    next_poll=start_time + schedule.next(0))
+
+    @staticmethod
+    def _since(waiters: Dict[str, dict]) -> int:
+        """Start time the task list must reach back to, to cover every waiting task"""
+        return min(upid_starttime(upid) for upid in waiters)
+
+    def _resolve(self, waiters: Dict[str, dict], tasks: list) -> Tuple[Dict[str, dict], List[str]]:
+        """
+        Match waiting tasks against a task list
+
+        Returns:
+            Tuple[Dict[str, dict], List[str]]: Final status of every task that
+            stopped, and tasks missing from the list too often, whose status
+            has to be queried directly
+        """
+        listed = {task['upid']: task for task in tasks or []}
+        finished = {}
+        lookups = []
+        for upid, waiter in waiters.items():
+            task = listed.get(upid)
+            if task is None:
+                # Task list can lag behind or be truncated, ask for the task itself
+                waiter['misses'] += 1
+                if waiter['misses'] >= self.MAX_MISSES:
+                    lookups.append(upid)
+            elif 'endtime' in task:
+                # Finished tasks carry their exit status in the status field
+                finished[upid] = dict(task, status='stopped', exitstatus=task.get('status'))
+        return finished, lookups
+
+    def _next_poll(self) -> float:
+        """Monotonic time at which the earliest waiting task is due"""
+        return min(waiter['next_poll'] for waiter in self._waiters.values())
+
+    def _advance(self):
+        """Schedule the next poll of every task that was due, all of them were just checked"""
+        now = time.monotonic()
+        for waiter in self._waiters.values():
+            if waiter['next_poll'] <= now:
+                waiter['next_poll'] = now + waiter['schedule'].next(now - waiter['start'])
+
+
+class TaskTracker(TaskListPoller):
+    """Track many Proxmox tasks with one task list request per poll interval"""
+    logger = Logger.get_logger()
+
+    def __init__(self, proxmox, node: str, scope: str = 'node', limit: int = 1000,
+                 durations: Optional[TaskDurations] = None, schedule: Optional[dict] = None):
+        """
+        Initialize task tracker
+
+        Args:
+            proxmox: Connected ProxmoxAPI
+            node: Node running the tasks
+            scope: Poll the 'node' task list or the 'cluster' task list (default: 'node')
+            limit: Maximum number of tasks fetched per poll (default: 1000)
+            durations: Task duration history used to time the polls
+            schedule: PollSchedule arguments (initial, factor, ceiling)
+        """
+        super().__init__(node, scope, limit)
+        self.proxmox = proxmox
+        self.durations = durations
+        self.schedule = schedule or {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def make_schedule(self, kind: str) -> PollSchedule:
+        """Create the poll schedule of a task kind"""
+        expected = self.durations.expected(kind) if self.durations else None
+        return PollSchedule(expected=expected, **self.schedule)
+
+    def wait(self, upid: str, timeout: float = 300, kind: Optional[str] = None) -> Optional[dict]:
+        """
+        Wait for a task to stop
+
+        Args:
+            upid: UPID of the task
+            timeout: Seconds to wait (default: 300)
+            kind: Task kind used to look up its expected duration (default: UPID task type)
+
+        Returns:
+            Optional[dict]: Final task status with 'status' and 'exitstatus',
+            None on timeout
+        """
+        kind = kind or upid_type(upid)
+        waiter = self._new_waiter(self.make_schedule(kind), event=threading.Event(), status=None)
+        with self._lock:
+            self._waiters[upid] = waiter
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        # The new task may need an earlier poll than the thread is sleeping for
+        self._wakeup.set()
+        finished = waiter['event'].wait(timeout)
+        with self._lock:
+            self._waiters.pop(upid, None)
+        if finished and self.durations and waiter['status'].get('exitstatus') == 'OK':
+            self.durations.record(kind, time.monotonic() - waiter['start'])
+        return waiter['status'] if finished else None
+
+    def _list_tasks(self, since: int) -> list:
+        """Fetch the task list covering every task started after `since`"""
+        self.api_calls += 1
+        if self.scope == 'cluster':
+            return self.proxmox.cluster.tasks.get()
+        return self.proxmox.nodes(self.node).tasks.get(source='all', since=since, limit=self.limit)
+
+    def poll(self):
+        """Resolve every outstanding task from a single task list request"""
+        with self._lock:
+            waiters = {upid: waiter for upid, waiter in self._waiters.items() if not waiter['event'].is_set()}
+        if not waiters:
+            return
+
+        finished, lookups = self._resolve(waiters, self._list_tasks(self._since(waiters)))
+        for upid in lookups:
+            self.api_calls += 1
+            status = self.proxmox.nodes(self.node).tasks(upid).status.get()
+            if status['status'] == 'stopped':
+                finished[upid] = status
+        for upid, status in finished.items():
+            waiters[upid]['status'] = status
+            waiters[upid]['event'].set()
+
+    def _run(self):
+        """Poll whenever the earliest outstanding task is due, until no task is being waited for"""
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._thread = None
+                    return
+                next_poll = self._next_poll()
+            delay = next_poll - time.monotonic()
+            if delay > 0:
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                self.logger.warning(f"Failed to poll task list: {e}")
+            with self._lock:
+                self._advance()
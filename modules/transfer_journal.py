@@ -0,0 +1,109 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, IO, List, Optional
+from utils.state import load_json, save_json
+
+
+class TransferJournal:
+    """
+    Persist committed chunk offsets of in-flight uploads on local disk
+
+    The JSON journal file only holds one header per transfer and is
+    rewritten when a transfer starts, is truncated or finishes. Chunk
+    digests are appended to a log file of their own transfer, so
+    committing a chunk costs one small synced write however large the
+    upload is.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize transfer journal
+
+        Args:
+            path: Path of the JSON journal file, chunk logs are kept in a
+                directory next to it
+        """
+        self.path = Path(path)
+        self.log_dir = self.path.with_suffix('.d')
+        self._lock = threading.Lock()
+        self._entries = load_json(self.path, {})
+        self._logs: Dict[str, IO[str]] = {}
+
+    def _log_path(self, key: str) -> Path:
+        """Path of the chunk log of a transfer"""
+        return self.log_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.log"
+
+    def _read_log(self, key: str) -> List[str]:
+        """Read the committed chunk digests, ignoring a line torn by a crash"""
+        try:
+            with open(self._log_path(key), 'r', encoding='utf-8') as f:
+                return [line[:-1] for line in f if line.endswith('\n')]
+        except FileNotFoundError:
+            return []
+
+    def _close_log(self, key: str):
+        """Close the open chunk log of a transfer"""
+        log = self._logs.pop(key, None)
+        if log is not None:
+            log.close()
+
+    def _write_log(self, key: str, chunks: List[str]):
+        """Replace the chunk log of a transfer"""
+        self._close_log(key)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log_path = self._log_path(key)
+        tmp_path = log_path.with_name(log_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{digest}\n" for digest in chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, log_path)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get journal entry of a transfer"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry, chunks=self._read_log(key)) if entry else None
+
+    def start(self, key: str, remote_file: str, size: int, mtime_ns: int, chunk_size: int) -> dict:
+        """Start a new journal entry, discarding any previous one"""
+        entry = {
+            'remote_file': remote_file,
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'chunk_size': chunk_size,
+        }
+        with self._lock:
+            self._write_log(key, [])
+            self._entries[key] = entry
+            save_json(self.path, self._entries, sync=True)
+        return dict(entry, chunks=[])
+
+    def commit_chunk(self, key: str, digest: str):
+        """Record a chunk as written and acknowledged by the remote side"""
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                log = self._logs[key] = open(self._log_path(key), 'a', encoding='utf-8')
+        # Only the thread uploading this transfer writes its log
+        log.write(f"{digest}\n")
+        log.flush()
+        os.fsync(log.fileno())
+
+    def truncate(self, key: str, chunks: int):
+        """Forget every committed chunk after the first `chunks` ones"""
+        with self._lock:
+            self._write_log(key, self._read_log(key)[:chunks])
+
+    def finish(self, key: str):
+        """Remove the journal entry of a completed transfer"""
+        with self._lock:
+            self._close_log(key)
+            try:
+                self._log_path(key).unlink()
+            except FileNotFoundError:
+                pass
+            if self._entries.pop(key, None) is not None:
+                save_json(self.path, self._entries, sync=True)
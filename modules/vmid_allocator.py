@@ -0,0 +1,128 @@
+import contextlib
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Set
+from utils.logger import Logger
+from utils.state import load_json, save_json
+
+try:
+    import fcntl
+except ImportError:  # file locking between runs is not available on Windows
+    fcntl = None
+
+
+class VmidAllocator:
+    """Allocate free VM IDs from configured ranges, reserved in a locked state file"""
+    logger = Logger.get_logger()
+
+    # Range used by `id: auto` entries without an `id_pool`, PVE itself starts at 100
+    DEFAULT_POOL = 'default'
+    DEFAULT_RANGE = (100, 999999999)
+    # Seconds a reservation blocks other runs if it is never released
+    RESERVATION_TTL = 3600
+
+    def __init__(self, path: Path, pools: Dict[str, object] = None, ttl: int = RESERVATION_TTL):
+        """
+        Initialize VM ID allocator
+
+        Args:
+            path: Reservation state file shared by all runs on this machine
+            pools: Pool name to ID range, given as `"1000-1999"`,
+                `[1000, 1999]` or `{start: 1000, end: 1999}`
+            ttl: Seconds until a reservation of an unfinished run expires
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.pools = {name: self.parse_range(spec) for name, spec in (pools or {}).items()}
+        self.pools.setdefault(self.DEFAULT_POOL, self.DEFAULT_RANGE)
+        self.run_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def parse_range(spec) -> tuple:
+        """Parse an ID range into inclusive (start, end)"""
+        if isinstance(spec, str):
+            start, _, end = spec.partition('-')
+        elif isinstance(spec, dict):
+            start, end = spec['start'], spec['end']
+        else:
+            start, end = spec
+        start, end = int(start), int(end)
+        if start < 100 or end < start:
+            raise ValueError(f"Invalid VM ID range: {spec}")
+        return start, end
+
+    def _reservations(self) -> dict:
+        """Load the unexpired reservations"""
+        now = time.time()
+        return {vmid: entry for vmid, entry in load_json(self.path, {}).items()
+                if entry.get('expires', 0) > now}
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[dict]:
+        """Hold the reservation file lock and yield its unexpired reservations"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                reservations = self._reservations()
+                yield reservations
+                save_json(self.path, reservations, sync=True)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def allocate(self, pools: List[str], taken: Set[int], reserve: bool = True) -> List[int]:
+        """
+        Reserve one free VM ID from the given pool per request
+
+        IDs are free if they are neither taken in the cluster snapshot nor
+        reserved by another unfinished run. Each pool is scanned from its
+        start, so allocations stay dense.
+
+        Args:
+            pools: Pool name of every requested ID, in request order
+            taken: IDs in use in the cluster or by the configuration
+            reserve: Record the IDs as reserved, otherwise they are only
+                looked up, as for a plan
+
+        Returns:
+            List[int]: Allocated IDs, in request order
+        """
+        for pool in pools:
+            if pool not in self.pools:
+                raise ValueError(f"Unknown VM ID pool: {pool}")
+
+        with self._locked() if reserve else contextlib.nullcontext(self._reservations()) as reservations:
+            unavailable = set(taken) | {int(vmid) for vmid in reservations}
+            cursors = {name: start for name, (start, _) in self.pools.items()}
+            allocated = []
+            for pool in pools:
+                vmid = cursors[pool]
+                end = self.pools[pool][1]
+                while vmid in unavailable:
+                    vmid += 1
+                if vmid > end:
+                    raise ValueError(f"VM ID pool {pool} {self.pools[pool]} has no free ID left")
+                unavailable.add(vmid)
+                cursors[pool] = vmid + 1
+                allocated.append(vmid)
+
+            if reserve:
+                expires = time.time() + self.ttl
+                for vmid in allocated:
+                    reservations[str(vmid)] = {'run': self.run_id, 'expires': expires}
+
+        if fcntl is None and reserve:
+            self.logger.warning("File locking is unavailable, concurrent runs may allocate the same VM IDs")
+        return allocated
+
+    def release(self, vmids: Iterable[int] = None):
+        """Drop the reservations of this run, only of the given IDs if any"""
+        vmids = None if vmids is None else {str(vmid) for vmid in vmids}
+        with self._locked() as reservations:
+            for vmid, entry in list(reservations.items()):
+                if entry.get('run') == self.run_id and (vmids is None or vmid in vmids):
+                    del reservations[vmid]
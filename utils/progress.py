@@ -0,0 +1,82 @@
+import logging
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+GREEN = '\033[32m'
+RESET = '\033[0m'
+BAR_WIDTH = 50
+
+
+class TransferProgress:
+    """Render per-file and total progress bars for concurrent transfers"""
+
+    def __init__(self, sizes: Dict[str, int], log_step: Optional[int] = None):
+        """
+        Initialize transfer progress display
+
+        Args:
+            sizes: Expected size in bytes of every file being transferred
+            log_step: Log progress every `log_step` percent instead of drawing
+                bars, for when other output is logged at the same time
+        """
+        self.sizes = dict(sizes)
+        self.transferred = {name: 0 for name in sizes}
+        self.log_step = log_step
+        self._logged = {name: -1 for name in sizes}
+        self._logged_total = -1
+        self._last_state = None
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bar(label: str, transferred: int, total: int) -> Tuple[str, int]:
+        """Format a single progress bar line"""
+        percentage = (transferred / total) * 100 if total else 100.0
+        filled = int(BAR_WIDTH * percentage / 100)
+        bar = '#' * filled + '_' * (BAR_WIDTH - filled)
+        return f"{GREEN}{label}: [{bar}] {percentage:5.1f}%{RESET}", int(percentage)
+
+    def update(self, name: str, transferred: int, total: int):
+        """Record progress of one file and redraw if any percentage changed"""
+        with self._lock:
+            self.sizes[name] = total
+            self.transferred[name] = transferred
+            if self.log_step:
+                step = int((transferred / total) * 100 if total else 100) // self.log_step
+                if step != self._logged.get(name):
+                    self._logged[name] = step
+                    logging.getLogger('ProxmoxManager').info(
+                        f"Upload progress: {name} {min(step * self.log_step, 100)}%")
+                done = sum(self.transferred.values())
+                size = sum(self.sizes.values())
+                step = int((done / size) * 100 if size else 100) // self.log_step
+                if step != self._logged_total and len(self.sizes) > 1:
+                    self._logged_total = step
+                    logging.getLogger('ProxmoxManager').info(
+                        f"Upload progress: total {min(step * self.log_step, 100)}% "
+                        f"({done / 1024 ** 2:.1f} of {size / 1024 ** 2:.1f} MB)")
+                return
+            width = max(len(n) for n in self.sizes)
+
+            lines = []
+            state = []
+            for file_name, size in self.sizes.items():
+                line, percentage = self._bar(file_name.ljust(width), self.transferred[file_name], size)
+                lines.append(line)
+                state.append(percentage)
+            line, percentage = self._bar('Total'.ljust(width), sum(self.transferred.values()),
+                                         sum(self.sizes.values()))
+            lines.append(line)
+            state.append(percentage)
+
+            if state == self._last_state:
+                return
+            self._last_state = state
+
+            # Move cursor back to the first bar before redrawing
+            if self._lines:
+                sys.stdout.write(f"\033[{self._lines}A")
+            sys.stdout.write(''.join(f"\r\033[K{line}\n" for line in lines))
+            sys.stdout.flush()
+            self._lines = len(lines)
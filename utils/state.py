@@ -0,0 +1,45 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+import logging
+
+
+def load_json(path: Path, default: Any = None) -> Any:
+    """
+    Load a JSON state file
+
+    Args:
+        path: Path of the state file
+        default: Value returned if the file is missing or unreadable
+
+    Returns:
+        Parsed file content or default
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        logging.getLogger('ProxmoxManager').warning(f"Ignoring unreadable state file {path}: {str(e)}")
+        return default
+
+
+def save_json(path: Path, data: Any, sync: bool = False):
+    """
+    Atomically write a JSON state file
+
+    Args:
+        path: Path of the state file
+        data: JSON serializable content
+        sync: fsync the file before replacing the old one
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)